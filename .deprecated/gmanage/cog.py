@@ -24,6 +24,7 @@ from typing import Union
 
 import discord
 from gmanage import __version__
+from gmanage.columns import SortColumns
 from gmanage.converters import FuzzyGuild
 from gmanage.io import read, write
 from jishaku.paginators import PaginatorEmbedInterface as PEI
@@ -55,6 +56,7 @@ class GMcog(commands.Cog, name="Guild Management Cog"):
                 "first run": True,
             },
         )
+        self.columns = SortColumns(bot.guilds)
 
     def cog_unload(self):
         write("./gmanage.data", self.data, indent=2, rollback=True)
@@ -91,24 +93,13 @@ class GMcog(commands.Cog, name="Guild Management Cog"):
         #     f":exclamation: Notice from developer: **gmanage is deprecated.** Please stop using it,"
         #     f" as it is no-longer maintained."
         # )
-        flags = [fl.lower() for fl in flags if fl.startswith("--")]
+        flags = [fl.lower() for fl in flags if fl.startswith("-")]
         guilds = self.bot.guilds
         extended = "--extended" in flags or "-e" in flags
         if flags:
-            if "--sort-by-join-recent" in flags or "-sbjr" in flags:
-                guilds = list(sorted(guilds, key=lambda g: g.me.joined_at, reverse=True))
-            if "--sort-by-join-oldest" in flags or "-sbjo" in flags:
-                guilds = list(sorted(guilds, key=lambda g: g.me.joined_at))
-            if "--sort-by-created-recent" in flags or "-sbcr" in flags:
-                guilds = list(sorted(guilds, key=lambda g: g.created_at, reverse=True))
-            if "--sort-by-created-oldest" in flags or "-sbco" in flags:
-                guilds = list(sorted(guilds, key=lambda g: g.created_at))
-            if "--sort-by-members" in flags or "-sbm" in flags:
-                guilds = list(sorted(guilds, key=lambda g: g.member_count, reverse=True))
-            if "--sort-by-bots" in flags or "-sbb" in flags:
-                guilds = list(sorted(guilds, key=lambda g: len([m for m in g.members if m.bot]), reverse=True))
-            if "--sort-to-enum" in flags or "-ste" in flags:
-                guilds = self.bot.guilds
+            if "--sort-to-enum" not in flags and "-ste" not in flags:
+                order = self.columns.sort([g.id for g in guilds], flags)
+                guilds = [self.bot.get_guild(guild_id) for guild_id in order]
         else:
             guilds = list(sorted(guilds, key=lambda g: g.name))
         e = discord.Embed(title=f"Guilds: {len(guilds)}", color=discord.Color.blurple())
@@ -129,17 +120,11 @@ class GMcog(commands.Cog, name="Guild Management Cog"):
             )
         except KeyError:
             pass
+        e.add_field(name="Most recently joined guild:", value=str(self.bot.get_guild(self.columns.largest("joined"))))
         e.add_field(
-            name="Most recently joined guild:",
-            value=list(sorted(guilds, key=lambda g: g.me.joined_at, reverse=True))[0].name,
-        )
-        e.add_field(
-            name="Most recently created server:",
-            value=list(sorted(guilds, key=lambda g: g.created_at, reverse=True))[0].name,
-        )
-        e.add_field(
-            name="Largest guild:", value=list(sorted(guilds, key=lambda g: g.member_count, reverse=True))[0].name
+            name="Most recently created server:", value=str(self.bot.get_guild(self.columns.largest("created")))
         )
+        e.add_field(name="Largest guild:", value=str(self.bot.get_guild(self.columns.largest("members"))))
         paginator = PEI if not extended else PI
         paginator = paginator(self.bot, commands.Paginator(prefix="```py", max_size=1950), embed=e)
         for n, guild in enumerate(guilds, start=1):
@@ -518,8 +503,26 @@ class GMcog(commands.Cog, name="Guild Management Cog"):
             if ctx.channel.permissions_for(ctx.me).manage_messages:
                 await ctx.message.delete(delay=60)
 
+    @commands.Cog.listener(name="on_ready")
+    async def columns_rebuild(self):
+        # the cog can load before the guild cache is filled, so the columns are built again once it is.
+        self.columns.rebuild(self.bot.guilds)
+
+    @commands.Cog.listener(name="on_guild_available")
+    async def columns_guild_available(self, guild: discord.Guild):
+        self.columns.add(guild)
+
+    @commands.Cog.listener(name="on_member_join")
+    async def columns_member_join(self, member: discord.Member):
+        self.columns.member_joined(member)
+
+    @commands.Cog.listener(name="on_member_remove")
+    async def columns_member_remove(self, member: discord.Member):
+        self.columns.member_left(member)
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
+        self.columns.add(guild)
         if self.data["newserverchannel"]:
             try:
                 channel = self.bot.get_channel(int(self.data["newserverchannel"]))
@@ -577,6 +580,7 @@ class GMcog(commands.Cog, name="Guild Management Cog"):
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
+        self.columns.remove(guild.id)
         if self.data["serverleavechannel"]:
             try:
                 channel = self.bot.get_channel(int(self.data["serverleavechannel"]))
@@ -0,0 +1,124 @@
+"""
+Copyright 2020 KableKompany
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+import discord
+
+# flag -> (column, descending), in the order the flags are documented to apply.
+SORT_FLAGS = {
+    "--sort-by-join-recent": ("joined", True),
+    "--sort-by-join-oldest": ("joined", False),
+    "--sort-by-created-recent": ("created", True),
+    "--sort-by-created-oldest": ("created", False),
+    "--sort-by-members": ("members", True),
+    "--sort-by-bots": ("bots", True),
+}
+SORT_ALIASES = {
+    "-sbjr": "--sort-by-join-recent",
+    "-sbjo": "--sort-by-join-oldest",
+    "-sbcr": "--sort-by-created-recent",
+    "-sbco": "--sort-by-created-oldest",
+    "-sbm": "--sort-by-members",
+    "-sbb": "--sort-by-bots",
+}
+COLUMNS = ("bots", "members", "joined", "created")
+
+
+class SortColumns:
+    """Per-guild sort keys (bot count, member count, join and creation time), kept current by the cog's listeners.
+
+    Each column is a guild id -> number dict, and the largest value of each column is tracked so the embed
+    fields don't have to sort anything. If the guild holding a maximum is removed or shrinks, the maximum is only
+    marked stale, and recomputed the next time it is read."""
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self.rebuild(guilds)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self.columns: Dict[str, Dict[int, float]] = {name: {} for name in COLUMNS}
+        self._max: Dict[str, Optional[int]] = {name: None for name in COLUMNS}
+        self._stale: Set[str] = set()
+        for guild in guilds:
+            self.add(guild)
+
+    def add(self, guild: discord.Guild):
+        joined = guild.me.joined_at if guild.me else None
+        self._set(guild.id, "bots", sum(1 for m in guild.members if m.bot))
+        self._set(guild.id, "members", guild.member_count)
+        self._set(guild.id, "joined", joined.timestamp() if joined else 0.0)
+        self._set(guild.id, "created", guild.created_at.timestamp())
+
+    def remove(self, guild_id: int):
+        for name, column in self.columns.items():
+            column.pop(guild_id, None)
+            if self._max[name] == guild_id:
+                self._stale.add(name)
+
+    def member_joined(self, member: discord.Member):
+        self._bump(member.guild.id, "members", 1)
+        if member.bot:
+            self._bump(member.guild.id, "bots", 1)
+
+    def member_left(self, member: discord.Member):
+        self._bump(member.guild.id, "members", -1)
+        if member.bot:
+            self._bump(member.guild.id, "bots", -1)
+
+    def largest(self, name: str) -> Optional[int]:
+        """Returns the id of the guild with the largest value in a column."""
+        if name in self._stale:
+            column = self.columns[name]
+            self._max[name] = max(column, key=column.__getitem__, default=None)
+            self._stale.discard(name)
+        return self._max[name]
+
+    def sort(self, guild_ids: List[int], flags: Iterable[str]) -> List[int]:
+        """Sorts guild ids by a stack of sort flags, in one pass.
+
+        Stacked flags used to re-sort the whole list once each, in :data:`SORT_FLAGS` order. Since every sort was
+        stable, the last flag decides the order and earlier flags only break ties, so the same order comes from a
+        single sort on a composite key, read from the last flag back."""
+        flags = {SORT_ALIASES.get(flag, flag) for flag in flags}
+        keys = [key for flag, key in SORT_FLAGS.items() if flag in flags]
+        if not keys:
+            return guild_ids
+        keys.reverse()
+        columns = [(self.columns[name], -1 if descending else 1) for name, descending in keys]
+        return sorted(guild_ids, key=lambda g: tuple(sign * column.get(g, 0) for column, sign in columns))
+
+    def _set(self, guild_id: int, name: str, value: float):
+        self.columns[name][guild_id] = value
+        self._update_max(guild_id, name)
+
+    def _bump(self, guild_id: int, name: str, delta: int):
+        column = self.columns[name]
+        if guild_id in column:
+            column[guild_id] += delta
+            if delta > 0:
+                self._update_max(guild_id, name)
+            elif self._max[name] == guild_id:
+                # another guild may be larger now, but a burst of leaves shouldn't rescan the column every time.
+                self._stale.add(name)
+
+    def _update_max(self, guild_id: int, name: str):
+        column = self.columns[name]
+        if name in self._stale:
+            return
+        current = self._max[name]
+        if current is None or current not in column or column[guild_id] > column[current]:
+            self._max[name] = guild_id
@@ -0,0 +1,337 @@
+"""
+Synthetic-scale benchmarks for the guildmanager cog.
+
+Builds lightweight stand-ins for the bot, guilds, members and channels at each size, loads the cog against them
+and times the hot paths: the ``Guild`` converter, ``search``, ``mutual``, the ``guilds`` root, ``filter``,
+``growth`` and ``bot_check``. Nothing connects to Discord.
+
+Results are written as JSON, and can be compared against a stored baseline; the exit status is 1 if anything got
+slower than the baseline by more than ``--tolerance``.
+
+    python benchmarks/scale.py [--sizes 1000 10000 100000] [--runs 20] [--out results.json]
+                               [--baseline baseline.json] [--save-baseline] [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import guildmanager  # noqa: E402
+from guildmanager.helpers import Guild  # noqa: E402
+
+_WORDS = (
+    "alpha bravo cosmic dragon echo falcon gaming hangout island jungle karma lounge meme night orbit pixel "
+    "quest radio squad tavern universe valley wolves xeno yacht zen anime art chill club code coffee den"
+).split()
+_EPOCH = datetime(2017, 1, 1)
+_FILTER = "members>10 bots/members>0.1 joined<2020-06 sort:-members limit:50"
+
+
+class FakeUser:
+    __slots__ = ("id", "name", "bot", "joined_at")
+
+    def __init__(self, user_id: int, name: str, *, bot: bool = False, joined_at: datetime = None):
+        self.id = user_id
+        self.name = name
+        self.bot = bot
+        self.joined_at = joined_at
+
+    def __str__(self):
+        return f"{self.name}#0001"
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class FakeChannel:
+    __slots__ = ("id", "name", "guild")
+
+    def __init__(self, channel_id: int, name: str, guild=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+    async def send(self, content=None, **kwargs):
+        return FakeMessage(content, **kwargs)
+
+    def typing(self):
+        return _Typing()
+
+
+class FakeMessage:
+    def __init__(self, content=None, **kwargs):
+        self.content = content
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.kwargs.update(kwargs)
+
+    async def add_reaction(self, emoji):
+        pass
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeGuild:
+    __slots__ = (
+        "id",
+        "name",
+        "owner_id",
+        "members",
+        "channels",
+        "text_channels",
+        "emojis",
+        "me",
+        "shard_id",
+        "created_at",
+        "features",
+    )
+
+    @property
+    def member_count(self):
+        return len(self.members)
+
+
+class FakeBot:
+    """Just enough of ``commands.Bot`` for the cog, its converter and jishaku's paginator."""
+
+    def __init__(self, guilds: List[FakeGuild], users: Dict[int, FakeUser], shard_count: int):
+        self.guilds = guilds
+        self.loop = asyncio.get_event_loop()
+        self.user = FakeUser(1, "bench", bot=True)
+        self.latency = 0.05
+        self.latencies = [(shard, 0.04 + shard / 1000) for shard in range(shard_count)]
+        self.shard_count = shard_count
+        self.cached_messages = ()
+        self.cogs = {}
+        self.extensions = {}
+        self.all_commands = {}
+        self.commands = set()
+        self._guilds = {g.id: g for g in guilds}
+        self._users = users
+
+    def get_guild(self, guild_id: int):
+        return self._guilds.get(guild_id)
+
+    def get_user(self, user_id: int):
+        return self._users.get(user_id)
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def walk_commands(self):
+        return iter(())
+
+    def is_closed(self):
+        return False
+
+    async def is_owner(self, user):
+        return True
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        # nobody ever reacts to a benchmark's paginator.
+        await self.loop.create_future()
+
+
+class FakeContext:
+    def __init__(self, bot: FakeBot, guild: FakeGuild):
+        self.bot = bot
+        self.guild = guild
+        self.channel = guild.text_channels[0]
+        self.author = guild.me
+        self.prefix = "!"
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    def typing(self):
+        return _Typing()
+
+    async def tick(self):
+        pass
+
+
+def build(size: int, *, members: int, seed: int = 0) -> FakeBot:
+    """Generates ``size`` guilds with about ``members`` cached members each, drawn from a shared user pool."""
+    rng = random.Random(seed)
+    users = {}
+    pool = [FakeUser(10 ** 17 + n, f"user{n}", bot=rng.random() < 0.05) for n in range(max(size * members // 4, 1))]
+    users.update((u.id, u) for u in pool)
+    owners = pool[: max(size // 3, 1)]
+    shard_count = max(size // 2500, 1)
+    span = (datetime(2021, 6, 1) - _EPOCH).total_seconds()
+    guilds = []
+    for n in range(size):
+        guild = FakeGuild()
+        guild.id = 7 * 10 ** 17 + n
+        guild.name = " ".join(rng.sample(_WORDS, rng.randint(1, 3))) + f" {n}"
+        # a long tail of owners, like a real bot's.
+        guild.owner_id = owners[min(int(rng.paretovariate(1.2)) - 1, len(owners) - 1)].id
+        guild.members = rng.sample(pool, min(rng.randint(1, members * 2), len(pool)))
+        guild.channels = [FakeChannel(8 * 10 ** 17 + n * 10 + c, f"channel-{c}", guild) for c in range(5)]
+        guild.text_channels = guild.channels[:3]
+        guild.emojis = [None] * rng.randint(0, 20)
+        joined = _EPOCH + timedelta(seconds=span * (n / size) ** 0.7)
+        guild.me = FakeUser(1, "bench", bot=True, joined_at=joined)
+        guild.shard_id = n % shard_count
+        guild.created_at = joined - timedelta(days=rng.randint(0, 900))
+        guild.features = []
+        guilds.append(guild)
+    return FakeBot(guilds, users, shard_count)
+
+
+async def timeit(func: Callable[[], Awaitable], *, runs: int, number: int = 1) -> dict:
+    """Times ``number`` calls of ``func``, ``runs`` times, after one warmup call. Reports per-call milliseconds."""
+    await func()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "min_ms": samples[0],
+    }
+
+
+async def bench_size(size: int, *, runs: int, members: int) -> Dict[str, dict]:
+    bot = build(size, members=members)
+    rng = random.Random(size)
+    results = {}
+
+    start = time.perf_counter()
+    cog = guildmanager.GuildManager(bot)
+    results["cog load"] = {"median_ms": (time.perf_counter() - start) * 1000}
+    bot.cogs["GuildManager"] = cog
+    try:
+        guild = rng.choice(bot.guilds)
+        ctx = FakeContext(bot, guild)
+        converter = Guild()
+        typo = guild.name[:-1] + "x" if len(guild.name) > 4 else guild.name
+        query = " ".join(rng.sample(_WORDS, 2))
+        user_id = max(bot._users, key=lambda uid: len(cog.members.mutual_guilds(uid)))
+
+        cases = {
+            "converter (id)": (lambda: converter.convert(ctx, str(guild.id)), 100),
+            "converter (channel id)": (lambda: converter.convert(ctx, str(guild.channels[-1].id)), 100),
+            "converter (name)": (lambda: converter.convert(ctx, guild.name), 100),
+            "converter (fuzzy)": (lambda: converter.convert(ctx, typo), 10),
+            "search (name)": (lambda: cog.gm_find.callback(cog, ctx, q=query), 1),
+            "search (owner)": (lambda: cog.gm_find.callback(cog, ctx, q=guild.owner_id), 1),
+            "mutual": (lambda: cog.gm_mutual.callback(cog, ctx, user=user_id), 1),
+            "guilds root": (lambda: cog.gm_root.callback(cog, ctx), 1),
+            "filter": (lambda: cog.gm_filter.callback(cog, ctx, query=_FILTER), 1),
+            "growth (cached)": (lambda: cog.gm_growth.callback(cog, ctx), 1),
+            "bot_check": (lambda: cog.bot_check(ctx), 1000),
+        }
+        for name, (func, number) in cases.items():
+            results[name] = await timeit(func, runs=runs, number=number)
+
+        async def growth():
+            cog.charts._cache.clear()
+            await cog.gm_growth.callback(cog, ctx)
+
+        results["growth (render)"] = await timeit(growth, runs=max(runs // 5, 1))
+    finally:
+        cog.cog_unload()
+        # paginators and the cog's loops never finish on their own; they have to actually unwind before the
+        # next size, or the loop is left with pending tasks when the harness exits.
+        pending = asyncio.all_tasks(bot.loop) - {asyncio.current_task()}
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns a line for every case that got slower than the baseline by more than ``tolerance``."""
+    regressions = []
+    for size, cases in results["results"].items():
+        for name, timing in cases.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before or not before["median_ms"]:
+                continue
+            ratio = timing["median_ms"] / before["median_ms"]
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    f"{size:>7} {name}: {before['median_ms']:.3f}ms -> {timing['median_ms']:.3f}ms ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--members", type=int, default=20, help="average cached members per guild")
+    parser.add_argument("--out", default=os.path.join(ROOT, "benchmarks", "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    out, baseline_path = os.path.abspath(args.out), os.path.abspath(args.baseline)
+    loop = asyncio.get_event_loop()
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "runs": args.runs},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as cwd:  # the cog writes ./gman.data
+        os.chdir(cwd)
+        for size in args.sizes:
+            results["results"][str(size)] = timings = loop.run_until_complete(
+                bench_size(size, runs=args.runs, members=args.members)
+            )
+            print(f"{size} guilds:")
+            for name, timing in timings.items():
+                print(f"  {name:>24}: {timing['median_ms']:.3f}ms")
+        os.chdir(ROOT)
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+    with open(out, "w") as fp:
+        json.dump(results, fp, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, "w") as fp:
+            json.dump(results, fp, indent=2)
+        return print(f"Saved baseline to {baseline_path}.")
+    if not os.path.exists(baseline_path):
+        return print(f"No baseline at {baseline_path}; run with --save-baseline to store one.")
+    with open(baseline_path) as fp:
+        regressions = compare(results, json.load(fp), args.tolerance)
+    if regressions:
+        print(f"Slower than baseline by more than {args.tolerance:.0%}:")
+        print("\n".join(regressions))
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Cold-start benchmark for the guildmanager cog.
+
+Each run happens in a fresh interpreter, so module caches are cold. Reports how long ``import guildmanager`` takes
+and how long ``setup(bot)`` takes against a bare, unconnected bot.
+
+    python benchmarks/startup.py [--runs 10] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import asyncio, json, time
+
+t0 = time.perf_counter()
+import guildmanager
+t1 = time.perf_counter()
+
+from discord.ext import commands
+
+
+async def main():
+    bot = commands.Bot(command_prefix="!")
+    t2 = time.perf_counter()
+    guildmanager.setup(bot)
+    t3 = time.perf_counter()
+    bot.remove_cog("GuildManager")
+    return t3 - t2
+
+
+setup_time = asyncio.get_event_loop().run_until_complete(main())
+print(json.dumps({"import": t1 - t0, "setup": setup_time}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as cwd:  # the cog writes ./gman.data
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD], cwd=cwd, env=env, check=True, stdout=subprocess.PIPE
+        ).stdout
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    summary = {}
+    for key in ("import", "setup"):
+        samples = [r[key] * 1000 for r in results]
+        summary[key] = {"median_ms": statistics.median(samples), "min_ms": min(samples), "max_ms": max(samples)}
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for key, s in summary.items():
+            print(f"{key:>6}: median {s['median_ms']:.1f}ms (min {s['min_ms']:.1f}ms, max {s['max_ms']:.1f}ms)")
+
+
+if __name__ == "__main__":
+    main()
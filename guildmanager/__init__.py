@@ -1,28 +1,41 @@
-import argparse
+import asyncio
 import io
-import json
 import logging
+import os
+import time
 import typing
 from datetime import datetime
 from typing import Union, Optional
 
 import discord
-import psutil
 from discord.ext import tasks
 from redbot.core import commands, checks
+from redbot.core.utils.predicates import MessagePredicate
 from humanize import intcomma as ic
 from humanize import naturaltime as nt
-from jishaku.paginators import PaginatorEmbedInterface
-from redbot.core.utils import AsyncIter
-
-from jishaku.shell import ShellReader
-from matplotlib import pyplot as plt
 
 log = logging.getLogger("red.kko-gm-ported.guildmanager")
 
-from .helpers import Guild, get_git_commit
+from . import export, filters
+from .bulk import BulkRunner
+from .charts import ChartRenderer, render_growth, render_history
+from .cluster import ClusterNode
+from .columns import GuildColumns
+from .helpers import Guild, LazyModule, get_git_commit
+from .history import MemberHistory
+from .index import GuildIndex, MemberIndex, OwnerIndex
+from .invites import InviteCache, create_first, invite_channels
+from .journal import Journal, apply
+from .latency import LatencySampler
+from .metrics import Metrics, serve, timed
+from .shards import ShardStats
+from .stats import BotStats
+from .timeline import JoinTimeline, month_range
 
 _DEFAULTS = {"banned": []}
+# vanity and infinite invites can still be deleted, so they are only trusted for this long.
+_INVITE_TTL = 600
+_TEMP_INVITE_AGE = 60
 _PERMS = {
     "read_messages": True,
     "send_messages": True,
@@ -34,9 +47,17 @@ _PERMS = {
 }
 
 __version__ = "1.0.0"
-__git_ver__ = get_git_commit()
 
-parser = argparse.ArgumentParser()  # soonTM
+
+def __getattr__(name):
+    # __git_ver__ is resolved on first access, so importing the cog never touches .git.
+    if name == "__git_ver__":
+        return get_git_commit()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# only needed by the paginated commands, so jishaku is imported on first use.
+pages = LazyModule(__name__ + ".pages")
 
 
 def percent(part: float, whole: float = 100.0, *, r: int = 0) -> float:
@@ -55,96 +76,422 @@ class GuildManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-        self.pings = 0.0
-        self.average_latency = float(self.bot.latency / 1000)
+        self.latency = LatencySampler()
 
         self.loaded = datetime.now()
+        self.index = GuildIndex(self.bot.guilds)
+        self.timeline = JoinTimeline(self.bot.guilds)
+        self.owners = OwnerIndex(self.bot.guilds)
+        self.members = MemberIndex(self.bot.guilds)
+        self.shards = ShardStats(self.bot.guilds)
+        self.columns = GuildColumns(self.bot.guilds)
+        self.charts = ChartRenderer()
+        self.invites = InviteCache()
 
-        try:
-            with open("./gman.data") as rfile:
-                data = json.load(rfile)
-            self.data = data
-            log.info(f"[GUILDMANAGER] loaded data from ./gman.data")
-        except Exception as e:
-            log.warning(
-                f"[GUILDMANAGER] Failed to load data from ./gman.data ({str(e)}), creating a new file"
-                f" with default settings."
-            )
-            with open("./gman.data", "w+") as wfile:
-                json.dump(_DEFAULTS, wfile)
-                self.data = _DEFAULTS
-        finally:
-            log.info("[GUILDMANAGER] Cog Loaded.")
-            self.sample_ping.start()
+        self.journal = Journal("./gman.data")
+        self.data = self.journal.load(_DEFAULTS)
+        # kept as a set so bot_check is a single hash lookup; persisted as a sorted list.
+        self.banned = self.data.pop("banned")
+        self.stats = BotStats(self.bot, debug=self.data.get("debug_stats", False))
+        log.info("[GUILDMANAGER] Cog Loaded.")
+        self.sample_ping.change_interval(seconds=self.data.get("ping_interval", 60))
+        self.sample_ping.start()
+        self.flush_journal.start()
+
+        self.bulk: Optional[BulkRunner] = None
+        self._bulk_task: Optional[asyncio.Task] = None
+
+        self.cluster: Optional[ClusterNode] = None
+        self.cluster_summaries: typing.Dict[str, dict] = {}
+        if self.data.get("cluster_socket"):
+            self.start_cluster(self.data["cluster_socket"])
+        self.publish_cluster.start()
+
+        self.metrics = Metrics(enabled=self.data.get("metrics", False))
+        self.metrics_server: Optional[asyncio.AbstractServer] = None
+        if self.data.get("metrics_port"):
+            self.bot.loop.create_task(self.start_metrics_server(self.data["metrics_port"]))
+        self.export_metrics.start()
+
+        self.history = MemberHistory("./gman.history")
+        self.sample_history.start()
 
     def cog_unload(self):
-        with open("./gman.data", "w") as wfile:
-            json.dump(self.data, wfile)
+        if self._bulk_task is not None:
+            # the runner would only write its last checkpoint once it unwinds, after the journal is closed below.
+            self._bulk_task.cancel()
+            self._record_bulk_done(self.bulk.stop())
+        self.flush_journal.cancel()
+        self.journal.close(self.snapshot())
+        self.charts.close()
+        self.publish_cluster.cancel()
+        self.stop_cluster()
+        self.export_metrics.cancel()
+        self.sample_history.cancel()
+        self.history.close()
+        self.stop_metrics_server()
         log.info(f"[GUILDMANAGER] Cog unloaded.")
         self.sample_ping.stop()
 
+    def snapshot(self) -> dict:
+        """Returns a copy of the cog's persistent state."""
+        return dict(self.data, banned=sorted(self.banned))
+
+    def set_setting(self, key: str, value):
+        """Changes a persistent setting."""
+        self.data[key] = value
+        self.journal.append("set", key=key, value=value)
+
+    @tasks.loop(seconds=5)
+    async def flush_journal(self):
+        """fsyncs the data journal, and compacts it in the background once it gets too big."""
+        self.journal.sync()
+        if self.journal.needs_compaction and self.journal.rotate():
+            await self.bot.loop.run_in_executor(None, self.journal.compact, self.snapshot())
+
+    def start_cluster(self, path: str):
+        """Joins the cluster aggregator at ``path``, hosting it if nobody else is."""
+        self.cluster = ClusterNode(path, str(self.data.get("cluster_id") or os.getpid()), self._answer_cluster)
+        self.cluster.start()
+
+    def stop_cluster(self):
+        if self.cluster is not None:
+            self.bot.loop.create_task(self.cluster.close())
+            self.cluster = None
+            self.cluster_summaries = {}
+
+    @tasks.loop(seconds=30)
+    async def publish_cluster(self):
+        """Publishes this cluster's guild summary, and fetches everybody else's."""
+        if self.cluster is None:
+            return
+        await self.cluster.publish(
+            {"guilds": len(self.index), "users": len(self.members), "shards": len(self.shards.guilds)}
+        )
+        self.cluster_summaries = await self.cluster.summaries()
+
+    @tasks.loop(seconds=15)
+    async def export_metrics(self):
+        """Rewrites the Prometheus textfile, if one is set."""
+        if self.metrics.enabled and self.data.get("metrics_textfile"):
+            try:
+                self.metrics.write(self.data["metrics_textfile"])
+            except OSError as e:
+                log.warning(f"[GUILDMANAGER] could not write metrics to {self.data['metrics_textfile']}: {e}")
+
+    @tasks.loop(hours=1)
+    async def sample_history(self):
+        """Appends every guild's member count to the history, and drops samples past the retention window."""
+        if not self.columns:
+            return
+        ids, counts = self.columns.evaluate(lambda v: (v["id"].tolist(), v["members"].copy()))
+        try:
+            self.history.record(ids, counts)
+            self.history.prune()
+        except OSError as e:
+            log.warning(f"[GUILDMANAGER] could not record member history: {e}")
+
+    async def start_metrics_server(self, port: int):
+        """Serves metrics over HTTP on localhost."""
+        self.stop_metrics_server()
+        try:
+            self.metrics_server = await serve(self.metrics, port)
+        except OSError as e:
+            log.warning(f"[GUILDMANAGER] could not serve metrics on port {port}: {e}")
+            return False
+        return True
+
+    def stop_metrics_server(self):
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+
+    async def _answer_cluster(self, kind: str, args: dict):
+        if kind == "search":
+            return [[g.id, g.name, *rank] for g, *rank in self.index.search(args["q"], limit=args["limit"])]
+        elif kind == "id":
+            guilds = self.guilds_owned_by(args["id"])
+            guild = self.index.get(args["id"])
+            if guild is not None:
+                guilds.insert(0, guild)
+            return [[g.id, g.name] for g in guilds]
+        elif kind == "mutual":
+            return [[g.id, g.name] for g in self.mutual_guilds(args["user_id"])]
+        raise ValueError(f"unknown cluster query {kind!r}")
+
+    async def query_cluster(self, kind: str, **args) -> typing.List[typing.Tuple[str, list]]:
+        """Asks every other cluster, returning ``(cluster, row)`` pairs. Empty when not clustered."""
+        if self.cluster is None:
+            return []
+        results = await self.cluster.query(kind, args)
+        return [(cluster, row) for cluster, rows in results.items() if rows for row in rows]
+
     async def cog_check(self, ctx: commands.Context):
         if not await ctx.bot.is_owner(ctx.author):
             raise discord.ext.commands.NotOwner()
 
         return True
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        if self.metrics.enabled:
+            ctx.gm_started = time.perf_counter()
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        started = getattr(ctx, "gm_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe("command", ctx.command.qualified_name, elapsed, ctx.command_failed)
+
+    @timed("check")
     async def bot_check(self, ctx):
-        if ctx.guild:
-            if ctx.guild.id in self.data.get("banned", []):
-                raise discord.ext.commands.CheckFailure(
-                    "This server is prohibited from using this bot. Please contact the bot owner" " to have this lifted."
-                )
+        if ctx.guild is not None and ctx.guild.id in self.banned:
+            raise discord.ext.commands.CheckFailure(
+                "This server is prohibited from using this bot. Please contact the bot owner" " to have this lifted."
+            )
         return True
 
+    def mutual_guilds(self, user_id: int) -> typing.List[discord.Guild]:
+        """Returns every guild the bot shares with a user, from the member index.
+
+        Other cogs may use this instead of walking every guild's member list."""
+        guilds = (self.index.get(guild_id) for guild_id in self.members.mutual_guilds(user_id))
+        return [g for g in guilds if g is not None]
+
+    def guilds_owned_by(self, owner_id: int) -> typing.List[discord.Guild]:
+        """Returns every guild owned by a user, from the owner index."""
+        guilds = (self.index.get(guild_id) for guild_id in self.owners.guilds_of(owner_id))
+        return [g for g in guilds if g is not None]
+
     @property
     def ping(self) -> float:
         """Returns the bot's average latency (heartbeat/api connection latency), in ms.
 
-        This is sampled every 10 min.
+        This is an EWMA over every shard, sampled every `ping_interval` seconds (60 by default).
         """
 
-        return self.average_latency
+        return self.latency.average()
+
+    @property
+    def average_latency(self) -> float:
+        return self.latency.average()
+
+    @property
+    def latency_percentiles(self) -> typing.Dict[float, float]:
+        """Returns the p50/p95/p99 latency over the sample buffer, in ms."""
+        return self.latency.percentiles()
 
     @property
-    def sampled_pings(self) -> float:
+    def shard_latencies(self) -> typing.Dict[Optional[int], typing.Tuple[float, typing.Dict[float, float]]]:
+        """Returns ``{shard id: (EWMA, {50: p50, 95: p95, 99: p99})}``, in ms."""
+        return {shard: (self.latency.average(shard), self.latency.percentiles(shard)) for shard in self.latency.shards}
+
+    @property
+    def sampled_pings(self) -> int:
         """returns how many times the cog has sampled pings."""
-        return self.pings
+        return self.latency.samples
 
-    @tasks.loop(seconds=600)
+    @tasks.loop(seconds=60)
     async def sample_ping(self):
         """
-        Samples pings every second.
+        Samples every shard's latency into the ring buffer.
         **Do NOT overwrite this!**
         """
-        self.pings += 1
-        latency = self.bot.latency * 1000
-        latency = latency / self.pings
-        self.average_latency = latency
+        latencies = getattr(self.bot, "latencies", None) or [(None, self.bot.latency)]
+        self.latency.sample(latencies)
+
+    def rebuild_caches(self):
+        """Rebuilds every guild-derived structure from ``bot.guilds``."""
+        guilds = self.bot.guilds
+        self.index.rebuild(guilds)
+        self.timeline.rebuild(guilds)
+        self.owners.rebuild(guilds)
+        self.members.rebuild(guilds)
+        self.stats.rebuild(guilds)
+        self.shards.rebuild(guilds)
+        self.columns.rebuild(guilds)
+
+    def _guild_added(self, guild: discord.Guild, *, joined: bool):
+        new = guild.id not in self.index
+        self.index.add(guild)
+        self.timeline.add(guild)
+        self.owners.add(guild)
+        self.members.add_guild(guild)
+        self.columns.add(guild)
+        if new:
+            # plain counters, so a guild becoming available again must not be counted twice.
+            self.stats.add_guild(guild)
+            self.shards.add(guild, joined=joined)
+
+    @commands.Cog.listener()
+    @timed("listener")
+    async def on_ready(self):
+        self.rebuild_caches()
+
+    @commands.Cog.listener()
+    @timed("listener")
+    async def on_resumed(self):
+        # no rebuild: a RESUME replays the missed events, so the listeners below have kept everything current.
+        # sharded bots dispatch this for every shard as well, and the on_shard_* listeners already cover those.
+        if self.bot.shard_count is None:
+            self.shards.shard_connected(None)
+
+    @commands.Cog.listener()
+    @timed("listener")
+    async def on_connect(self):
+        if self.bot.shard_count is None:
+            self.shards.shard_connected(None)
+
+    @commands.Cog.listener()
+    @timed("listener")
+    async def on_disconnect(self):
+        if self.bot.shard_count is None:
+            self.shards.shard_disconnected(None)
+
+    @commands.Cog.listener(name="on_shard_connect")
+    @commands.Cog.listener(name="on_shard_resumed")
+    @timed("listener")
+    async def track_shard_connect(self, shard_id: int):
+        self.shards.shard_connected(shard_id)
+
+    @commands.Cog.listener(name="on_shard_disconnect")
+    @timed("listener")
+    async def track_shard_disconnect(self, shard_id: int):
+        self.shards.shard_disconnected(shard_id)
+
+    @commands.Cog.listener(name="on_guild_join")
+    @timed("listener")
+    async def track_guild_join(self, guild: discord.Guild):
+        self._guild_added(guild, joined=True)
+
+    @commands.Cog.listener(name="on_guild_available")
+    @timed("listener")
+    async def track_guild_available(self, guild: discord.Guild):
+        self._guild_added(guild, joined=False)
+
+    @commands.Cog.listener(name="on_guild_remove")
+    @timed("listener")
+    async def track_guild_remove(self, guild: discord.Guild):
+        if guild.id not in self.index:
+            return
+        self.index.remove(guild)
+        self.timeline.remove(guild.id)
+        self.owners.remove(guild.id)
+        self.members.remove_guild(guild)
+        self.stats.remove_guild(guild)
+        self.shards.remove(guild)
+        self.columns.remove(guild.id)
+        self.invites.drop(guild.id)
+
+    @commands.Cog.listener(name="on_invite_delete")
+    @timed("listener")
+    async def track_invite_delete(self, invite: discord.Invite):
+        if invite.guild is not None:
+            self.invites.drop(invite.guild.id, invite.url)
+
+    @commands.Cog.listener(name="on_guild_update")
+    @timed("listener")
+    async def track_guild_update(self, before: discord.Guild, after: discord.Guild):
+        self.index.rename(before, after)
+        if before.owner_id != after.owner_id:
+            self.owners.add(after)
+            self.columns.set_owner(after.id, after.owner_id)
+
+    @commands.Cog.listener(name="on_member_join")
+    @timed("listener")
+    async def track_member_join(self, member: discord.Member):
+        self.members.add(member.id, member.guild.id)
+        self.columns.member_changed(member.guild.id, bot=member.bot, delta=1)
+
+    @commands.Cog.listener(name="on_member_remove")
+    @timed("listener")
+    async def track_member_remove(self, member: discord.Member):
+        self.members.remove(member.id, member.guild.id)
+        self.columns.member_changed(member.guild.id, bot=member.bot, delta=-1)
+
+    @commands.Cog.listener(name="on_guild_channel_create")
+    @timed("listener")
+    async def track_channel_create(self, channel):
+        self.index.add_channel(channel)
+        self.stats.channels += 1
+
+    @commands.Cog.listener(name="on_guild_channel_delete")
+    @timed("listener")
+    async def track_channel_delete(self, channel):
+        self.index.remove_channel(channel)
+        self.stats.channels -= 1
+
+    @commands.Cog.listener(name="on_guild_emojis_update")
+    @timed("listener")
+    async def track_emojis_update(self, guild: discord.Guild, before, after):
+        self.stats.emojis += len(after) - len(before)
+
+    @commands.Cog.listener(name="on_cog_add")
+    @commands.Cog.listener(name="on_cog_remove")
+    @timed("listener")
+    async def track_cogs(self, cog: commands.Cog):
+        self.stats.commands_changed()
 
     @commands.group(name="guilds", aliases=["kkoserv", "gm"], invoke_without_command=True)
     @commands.bot_has_permissions(**_PERMS)
     async def gm_root(self, ctx: commands.Context):
         """Shows a nice list of your bot's servers."""
-        group_commands = sum([1 for n in self.bot.walk_commands() if isinstance(n, commands.Group)])
+        if self.stats.debug:
+            self.stats.verify()
+        single_commands, group_commands, sub_commands = self.stats.commands
 
-        e = discord.Embed(title=f"You have: {len(self.bot.guilds)} guilds.")
+        e = discord.Embed(title=f"You have: {len(self.index)} guilds.")
         e.add_field(
             name="All Statistics:",
-            value=f"**Guilds:** {len(self.bot.guilds)}\n"
-            f"**Channels:** {len(list(self.bot.get_all_channels()))}\n"
-            f"**Users:** {len(self.bot.users)}\n"
-            f"**Emojis:** {len(set(self.bot.emojis))}\n"
+            value=f"**Guilds:** {len(self.index)}\n"
+            f"**Shards:** {len(self.shards.guilds)}\n"
+            f"**Channels:** {self.stats.channels}\n"
+            f"**Users:** {len(self.members)}\n"
+            f"**Emojis:** {self.stats.emojis}\n"
             f"**Cached Messages:** {len(self.bot.cached_messages)}\n"
             f"**Average Ping:** `{round(self.average_latency, 3)}ms`\n"
+            f"**Ping p50/p95/p99:** `{'/'.join(str(round(v, 1)) for v in self.latency_percentiles.values())}ms`\n"
             f"\n"
             f"**Loaded Cogs:** {len(self.bot.cogs)}\n"
             f"**Loaded Extensions:** {len(self.bot.extensions)}\n"
             f"\n"
-            f"**Total single commands:** {len(self.bot.commands)}\n"
+            f"**Total single commands:** {single_commands}\n"
             f"**Total group commands:** {group_commands}\n"
-            f"**Total sub commands:** {sum([1 for n in self.bot.walk_commands() if n.parent])}",
+            f"**Total sub commands:** {sub_commands}",
+        )
+        shards = self.shard_latencies
+        if len(shards) > 1:
+            worst = sorted(shards.items(), key=lambda item: item[1][1][95], reverse=True)[:5]
+            e.add_field(
+                name="Slowest shards (EWMA / p95 / p99):",
+                value="\n".join(
+                    f"**{shard}:** `{round(ewma, 1)} / {round(pcts[95], 1)} / {round(pcts[99], 1)}ms`"
+                    for shard, (ewma, pcts) in worst
+                ),
+            )
+        if len(self.shards.guilds) > 1:
+            busiest = sorted(self.shards.guilds.items(), key=lambda item: item[1], reverse=True)[:10]
+            e.add_field(
+                name="Busiest shards (guilds / joins per hour):",
+                value="\n".join(
+                    f"**{shard}:** {ic(count)} / {round(self.shards.join_rate(shard), 2)}" for shard, count in busiest
+                ),
+            )
+        sizes = self.columns.summary()
+        e.add_field(
+            name="Guild sizes:",
+            value=f"**Members (sum):** {ic(sizes['members'])}\n"
+            f"**Bots (sum):** {ic(sizes['bots'])} ({percent(sizes['bots'], sizes['members'] or 1)}%)\n"
+            f"**Median members:** {ic(round(sizes['median']))}\n"
+            f"**Largest guild:** {ic(sizes['largest'])}\n"
+            f"**Mostly bots:** {ic(sizes['bot_heavy'])} guilds",
         )
+        if self.cluster_summaries:
+            e.add_field(
+                name=f"Cluster ({len(self.cluster_summaries)} processes):",
+                value=f"**Guilds:** {sum(c['guilds'] for c in self.cluster_summaries.values())}\n"
+                f"**Users:** {sum(c['users'] for c in self.cluster_summaries.values())}\n"
+                f"**Shards:** {sum(c['shards'] for c in self.cluster_summaries.values())}",
+            )
         e.add_field(
             name="Cog Info",
             value=f"**Loaded:** {nt(self.loaded)}\n"
@@ -152,81 +499,183 @@ class GuildManager(commands.Cog):
             f"**Version:** {__version__}",
         )
 
-        #
-        owners = []
-        guilds = []
-        async for g in AsyncIter(self.bot.guilds, steps=100):
-            owners.append(g.owner)
-            guilds.append(g)
         v = ""
-        sorted_ = sorted(set(owners), key=lambda x: percent(owners.count(x), len(owners)), reverse=True)
-        for n, user in enumerate(list(sorted_)[:10], start=1):
-            v += f"{n}. {user} ({percent(owners.count(user), len(owners))}%)\n"
+        for n, (owner_id, count) in enumerate(self.owners.top(10), start=1):
+            user = self.bot.get_user(owner_id) or owner_id
+            v += f"{n}. {user} ({percent(count, len(self.owners))}%)\n"
         e.add_field(name="Guild owners, sorted by number of servers they own that uses the bot:", value=v)
 
-        paginator = PaginatorEmbedInterface(self.bot, commands.Paginator("", "", max_size=1990), embed=e)
-        
-        for n, guild in enumerate(guilds):
-            await paginator.add_line(f"{ic(n)}. {guild} (`{guild.id}`): {guild.member_count}")
+        def fmt(n: int, guild: discord.Guild) -> str:
+            name = guild.name if len(guild.name) <= 80 else guild.name[:77] + "..."
+            return f"{ic(n)}. {name} (`{guild.id}`): {guild.member_count}"
+
+        paginator = pages.LazyPaginatorInterface(self.bot, pages.GuildPages(self.index, fmt), embed=e)
         await paginator.send_to(ctx.channel)
 
+    @gm_root.command(name="cluster")
+    async def gm_cluster(self, ctx: commands.Context, path: str = None, cluster_id: str = None):
+        """Shares guild summaries, `search` and `mutual` with other bot processes through a Unix socket at `path`.
+
+        Every process should point at the same path; the first one up hosts the aggregator.
+        `cluster_id` names this process in results (defaults to its PID). Leave `path` blank to disable."""
+        self.stop_cluster()
+        self.set_setting("cluster_socket", path)
+        self.set_setting("cluster_id", cluster_id)
+        if path is None:
+            return await ctx.send("Cluster sharing disabled.")
+        self.start_cluster(path)
+        return await ctx.send(f"Sharing with other clusters through `{path}`.")
+
+    @gm_root.command(name="shards")
+    async def gm_shards(self, ctx: commands.Context, show_all: bool = False, threshold: float = 1000.0):
+        """Lists degraded shards: disconnected, or with a p95 latency over `threshold` ms.
+
+        If `show_all` is True, every shard is listed with its guild count, latency, join rate and disconnects."""
+        if show_all:
+            shards = sorted(self.shards.guilds, key=lambda s: s or 0)
+        else:
+            degraded = self.shards.degraded(self.latency, threshold=threshold)
+            if not degraded:
+                return await ctx.send(f"All {len(self.shards.guilds)} shards are healthy.")
+            shards = [shard for shard, _ in degraded]
+            reasons = dict(degraded)
+        paginator = commands.Paginator("```md", max_size=1800)
+        for shard in shards:
+            p95 = self.latency.percentiles(shard, (95,))[95]
+            line = (
+                f"{shard}. {self.shards.guilds.get(shard, 0)} guilds, {round(self.latency.average(shard), 1)}ms avg"
+                f" / {round(p95, 1)}ms p95, {round(self.shards.join_rate(shard), 2)} joins/h,"
+                f" {self.shards.disconnects.get(shard, 0)} disconnects"
+            )
+            if not show_all:
+                line += f" [{reasons[shard]}]"
+            paginator.add_line(line)
+        for page in paginator.pages:
+            await ctx.send(page)
+
+    @gm_root.command(name="pinginterval")
+    async def gm_pinginterval(self, ctx: commands.Context, seconds: int):
+        """Sets how often latency is sampled, in seconds. The last 360 samples are kept."""
+        if seconds < 5:
+            return await ctx.send("The interval must be at least 5 seconds.")
+        self.set_setting("ping_interval", seconds)
+        self.sample_ping.change_interval(seconds=seconds)
+        return await ctx.send(f"Sampling latency every {seconds} seconds.")
+
+    @gm_root.command(name="debugstats", hidden=True)
+    async def gm_debugstats(self, ctx: commands.Context, toggle: bool = None):
+        """Toggles checking the `guilds` statistics against a full recount every time they are shown."""
+        toggle = not self.stats.debug if toggle is None else toggle
+        self.stats.debug = toggle
+        self.set_setting("debug_stats", toggle)
+        if toggle and not self.stats.verify():
+            return await ctx.send("Stats debugging enabled. Counters had drifted, see the log.")
+        return await ctx.send(f"Stats debugging {'enabled' if toggle else 'disabled'}.")
+
+    @gm_root.group(name="stats", invoke_without_command=True)
+    async def gm_stats(self, ctx: commands.Context):
+        """Shows call counts, errors and timings of this cog's commands, listeners and checks."""
+        if not self.metrics.enabled:
+            return await ctx.send(f"Metrics are disabled. Enable them with `{ctx.prefix}guilds stats toggle`.")
+        rows = self.metrics.table()
+        if not rows:
+            return await ctx.send("Nothing recorded yet.")
+        paginator = commands.Paginator("```md", max_size=1800)
+        paginator.add_line(f"{'name':<32} {'calls':>8} {'errors':>6} {'mean':>9} {'p50':>9} {'p95':>9}")
+        for kind, name, calls, errors, mean, p50, p95 in rows:
+            name = f"{kind[0]}:{name}"[:32]
+            paginator.add_line(f"{name:<32} {calls:>8} {errors:>6} {mean:>7.2f}ms {p50:>7.2f}ms {p95:>7.2f}ms")
+        for page in paginator.pages:
+            await ctx.send(page)
+
+    @gm_stats.command(name="toggle")
+    async def gm_stats_toggle(self, ctx: commands.Context, toggle: bool = None):
+        """Turns metrics collection on or off."""
+        toggle = not self.metrics.enabled if toggle is None else toggle
+        self.metrics.enabled = toggle
+        self.set_setting("metrics", toggle)
+        return await ctx.send(f"Metrics {'enabled' if toggle else 'disabled'}.")
+
+    @gm_stats.command(name="reset")
+    async def gm_stats_reset(self, ctx: commands.Context):
+        """Clears everything recorded so far."""
+        self.metrics.reset()
+        await ctx.tick()
+
+    @gm_stats.command(name="textfile")
+    async def gm_stats_textfile(self, ctx: commands.Context, *, path: str = None):
+        """Writes metrics in Prometheus text format to `path` every 15 seconds, e.g. for node_exporter's textfile
+        collector. Leave blank to stop."""
+        self.set_setting("metrics_textfile", path)
+        if path is None:
+            return await ctx.send("No longer writing metrics to a file.")
+        return await ctx.send(f"Writing metrics to `{path}` every 15 seconds.")
+
+    @gm_stats.command(name="http")
+    async def gm_stats_http(self, ctx: commands.Context, port: int = None):
+        """Serves metrics for Prometheus at `http://127.0.0.1:<port>/metrics`. Leave blank to stop."""
+        self.set_setting("metrics_port", port)
+        if port is None:
+            self.stop_metrics_server()
+            return await ctx.send("No longer serving metrics.")
+        if not await self.start_metrics_server(port):
+            return await ctx.send(f"Unable to listen on port {port}, see the log.")
+        return await ctx.send(f"Serving metrics at `http://127.0.0.1:{port}/metrics`.")
+
     @gm_root.command(name="invite")
     async def gm_invite(self, ctx: commands.Context, *, guild: Guild):
         """Tries to get an invite from a guild.
 
         Logic is as follows:
-            1. get invites
+            1. use the vanity invite
+            if there is none:
+            2. get invites
             if that fails:
-            2. generate a temp invite
+            3. generate a temp invite
             if that fails
-            3. cry"""
+            4. cry
+
+        Vanity and infinite invites are remembered for a while, so asking again doesn't hit the API."""
         guild: discord.Guild
+        cached = self.invites.get(guild.id)
+        if cached is not None:
+            return await ctx.send(f"{cached[0]}: <{cached[1]}>", delete_after=10)
+        # reusing an existing invite only saves creating one, so failing to fetch them just falls through.
         if "VANITY_URL" in guild.features:
-            i = await guild.vanity_invite()
-            return await ctx.send(f"Vanity Invite: <{i.url}>", delete_after=10)
+            try:
+                i = await guild.vanity_invite()
+            except discord.HTTPException as e:
+                log.debug(f"[GUILDMANAGER] could not fetch the vanity invite of {guild.id}: {e}")
+            else:
+                self.invites.put(guild.id, "Vanity Invite", i.url, _INVITE_TTL)
+                return await ctx.send(f"Vanity Invite: <{i.url}>", delete_after=10)
+        m = await ctx.send("Attempting to find an invite.")
         if guild.me.guild_permissions.manage_guild:
-            m = await ctx.send("Attempting to find an invite.")
-            invites = await guild.invites()
-            for invite in invites:
+            try:
+                existing = await guild.invites()
+            except discord.HTTPException as e:
+                log.debug(f"[GUILDMANAGER] could not fetch the invites of {guild.id}: {e}")
+                existing = []
+            for invite in existing:
                 if invite.max_age == 0:
+                    self.invites.put(guild.id, "Infinite Invite", invite.url, _INVITE_TTL)
                     return await m.edit(content=f"Infinite Invite: {invite}")
-            else:
-                await m.edit(content="No Infinite Invites found - creating.")
-                for channel in guild.text_channels:
-                    try:
-                        invite = await channel.create_invite(
-                            max_age=60,
-                            max_uses=1,
-                            unique=True,
-                            reason=f"Invite requested"
-                            f" by {ctx.author} via official management command. "
-                            f"do not be alarmed, this is usually just"
-                            f" to check something.",
-                        )
-                        break
-                    except:
-                        continue
-                else:
-                    return await m.edit(content=f"Unable to create an invite - missing permissions.")
-                await m.edit(content=f"Temp invite: {invite.url} -> max age: 60s, max uses: 1")
-        else:
-            m = await ctx.send("Attempting to create an invite.")
-            for channel in guild.text_channels:
-                try:
-                    invite = await channel.create_invite(
-                        max_age=60,
-                        max_uses=1,
-                        unique=True,
-                        reason=f"Invite requested"
-                        f" by {ctx.author} via official management command. do not be alarmed, this is usually just"
-                        f" to check something.",
-                    )
-                    break
-                except:
-                    continue
-            else:
-                return await m.edit(content=f"Unable to create an invite - missing permissions.")
-            await m.edit(content=f"Temp invite: {invite.url} -> max age: 60s, max uses: 1")
+            await m.edit(content="No Infinite Invites found - creating.")
+        try:
+            invite = await create_first(
+                invite_channels(guild),
+                max_age=_TEMP_INVITE_AGE,
+                max_uses=1,
+                unique=True,
+                reason=f"Invite requested by {ctx.author} via official management command. "
+                f"do not be alarmed, this is usually just to check something.",
+            )
+        except discord.HTTPException as e:
+            return await m.edit(content=f"Unable to create an invite: {e}")
+        if invite is None:
+            return await m.edit(content=f"Unable to create an invite - missing permissions.")
+        # not cached: it is single use, so the next person to ask would be handed a dead link.
+        await m.edit(content=f"Temp invite: {invite.url} -> max age: {_TEMP_INVITE_AGE}s, max uses: 1")
 
     @gm_root.command(name="leave", aliases=["rem", "remove"])
     async def gm_leave(self, ctx: commands.Context, *, guild: Guild):
@@ -238,22 +687,18 @@ class GuildManager(commands.Cog):
     @gm_root.command(name="mutual", aliases=["in"])
     async def gm_mutual(self, ctx: commands.Context, *, user: Union[discord.Member, discord.User, int]):
         """Tells you how many mutual guilds the bot has with another user."""
-        if isinstance(user, int):
-            return await ctx.send("User not found.")
-        paginator = commands.Paginator("```md")
-        n = 1
-        r = 0
-        for n, guild in enumerate(self.bot.guilds, start=1):
-            if user in guild.members:
-                paginator.add_line(f"{n}. {guild.name}")
-                r += 1
-        if len(paginator.pages) == 0:
+        user_id = user if isinstance(user, int) else user.id
+        lines = [f"{guild.name}" for guild in self.mutual_guilds(user_id)]
+        remote = await self.query_cluster("mutual", user_id=user_id)
+        lines += [f"{name} [cluster {cluster}]" for cluster, (_, name) in remote]
+        if not lines:
             return await ctx.send(f"`0` mutual guilds.")
-        else:
-            await ctx.send(f"`{n}` mutual guilds:\n{paginator.pages[0]}")
-            if len(paginator.pages) >= 2:
-                for page in paginator.pages[1:]:
-                    await ctx.send(page)
+        paginator = commands.Paginator("```md")
+        for n, line in enumerate(lines, start=1):
+            paginator.add_line(f"{n}. {line}")
+        await ctx.send(f"`{len(lines)}` mutual guilds:\n{paginator.pages[0]}")
+        for page in paginator.pages[1:]:
+            await ctx.send(page)
 
     # @gm_root.command(name="update", hidden=True)
     # async def update(self, ctx, *, version: str = None):
@@ -273,7 +718,7 @@ class GuildManager(commands.Cog):
     #                 + (" --upgrade" if not version else f"=={version}")
     #             )
 
-    #     paginator = PaginatorEmbedInterface(self.bot, commands.Paginator("```bash", "```", 1600))
+    #     paginator = paginators.PaginatorEmbedInterface(self.bot, commands.Paginator("```bash", "```", 1600))
     #     async with ctx.channel.typing():
     #         with ShellReader(run, 120) as reader:
     #             async for line in reader:
@@ -288,86 +733,274 @@ class GuildManager(commands.Cog):
     async def gm_find(self, ctx: commands.Context, *, q: Union[discord.User, int, str]):
         """Iterates through bot.guilds, and if `q` is equal to owner, ID, or name, matches.
 
+        Names are matched fuzzily, and the 50 closest matches are shown best first.
+
         For a more in-depth version of this, like checking channel/role names, etc, use `[p]guilds get`."""
-        if isinstance(q, discord.User):
-            matches = []
-            async for guild in AsyncIter(self.bot.guilds, steps=100):
-                if guild.owner == q:
-                    matches.append(guild)
-                    continue
+        if isinstance(q, (discord.User, int)):
+            owner_id = q.id if isinstance(q, discord.User) else q
+            matches = [(match.id, match.name, None) for match in self.guilds_owned_by(owner_id)]
+            if isinstance(q, int):
+                guild = self.index.get(q)
+                if guild is not None:
+                    matches.insert(0, (guild.id, guild.name, None))
+            remote = await self.query_cluster("id", id=owner_id)
+            matches += [(guild_id, name, cluster) for cluster, (guild_id, name) in remote]
             if len(matches) == 0:
                 return await ctx.send(f"No matches.")
             else:
-                pc = percent(len(matches), len(self.bot.guilds), r=2)
                 paginator = commands.Paginator("```md", max_size=1800)
-                for n, match in enumerate(matches, start=1):
-                    paginator.add_line(f"{n}. {match.name} ({match.id})")
-
-                first_page = f"{q.mention} owns {pc}% of the bot's servers:\n{paginator.pages[0]}"
-                await ctx.send(first_page)
-                if len(paginator.pages) > 1:
-                    for page in paginator.pages:
-                        await ctx.send(page)
-        elif isinstance(q, int):
-            matches = []
-            for guild in self.bot.guilds:
-                if guild.owner.id == q or guild.id == q:
-                    matches.append(guild)
-                    continue
-            if len(matches) == 0:
-                return await ctx.send(f"No matches.")
-            else:
-                pc = percent(len(matches), len(self.bot.guilds), r=2)
-                paginator = commands.Paginator("```md", max_size=1800)
-                for n, match in enumerate(matches, start=1):
-                    paginator.add_line(f"{n}. {match.name} ({match.id})")
-
-                first_page = paginator.pages[0]
-                await ctx.send(first_page)
-                if len(paginator.pages) > 1:
-                    for page in paginator.pages:
-                        await ctx.send(page)
+                for n, (guild_id, name, cluster) in enumerate(matches, start=1):
+                    paginator.add_line(f"{n}. {name} ({guild_id})" + (f" [cluster {cluster}]" if cluster else ""))
+
+                chunks = paginator.pages
+                if isinstance(q, discord.User):
+                    total = sum(c["guilds"] for c in self.cluster_summaries.values()) or len(self.index)
+                    pc = percent(len(matches), total, r=2)
+                    chunks[0] = f"{q.mention} owns {pc}% of the bot's servers:\n{chunks[0]}"
+                for page in chunks:
+                    await ctx.send(page)
         else:
-            matches = []
-            for guild in self.bot.guilds:
-                if guild.name.lower() in q.lower() or q.lower() in guild.name.lower():
-                    matches.append(guild)
-                    continue
+            matches = [(rank, match.id, match.name, None) for match, *rank in self.index.search(q, limit=50)]
+            remote = await self.query_cluster("search", q=q, limit=50)
+            matches += [(rank, guild_id, name, cluster) for cluster, (guild_id, name, *rank) in remote]
+            # (containment, similarity), the same order every index ranks its own results in.
+            matches = sorted(matches, key=lambda m: m[0], reverse=True)[:50]
             if len(matches) == 0:
                 return await ctx.send(f"No matches.")
             else:
-                pc = percent(len(matches), len(self.bot.guilds), r=2)
                 paginator = commands.Paginator("```md", max_size=1800)
-                for n, match in enumerate(matches, start=1):
-                    paginator.add_line(f"{n}. {match.name} ({match.id})")
+                for n, ((_, score), guild_id, name, cluster) in enumerate(matches, start=1):
+                    line = f"{n}. {name} ({guild_id}) [{percent(score, 1)}% similar]"
+                    paginator.add_line(line + (f" [cluster {cluster}]" if cluster else ""))
 
-                first_page = paginator.pages[0]
-                await ctx.send(first_page)
-                if len(paginator.pages) > 1:
-                    for page in paginator.pages:
-                        await ctx.send(page)
+                for page in paginator.pages:
+                    await ctx.send(page)
 
     @gm_root.command(name="growth", aliases=["graph"])
-    async def gm_growth(self, ctx: commands.Context): #, since: TimedeltaConverter=None futures
-        """Shows your growth statistics, in a neat little graph!"""
-        plt.clf()
-        guilds = [guild.me.joined_at for guild in self.bot.guilds]
-        guilds.sort(key=lambda g: g)
-        plt.grid(True)
-        fig, ax = plt.subplots()
-
-        ax.plot(guilds, tuple(range(len(guilds))), lw=2)
-
-        fig.autofmt_xdate()
-
-        plt.xlabel("Date")
-        plt.ylabel("Guilds")
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png")
-        buf.seek(0)
-        e = discord.Embed(color=discord.Color.orange())
+    async def gm_growth(self, ctx: commands.Context, period: str = None):
+        """Shows your growth statistics, in a neat little graph!
+
+        `period` can be a month in the format of `m/YYYY` or `m/yy`. Leave blank to get from start of bot to now."""
+        if period:
+            for fmt in ("%m/%Y", "%m/%y"):
+                try:
+                    month = datetime.strptime(period, fmt)
+                except ValueError:
+                    continue
+                break
+            else:
+                return await ctx.send("Unable to convert to any time.")
+            start, end = month_range(month.year, month.month)
+            joined = self.timeline.between(start, end)
+            days = (end - start).days
+            description = (
+                f"Total guilds joined in {month.month}/{month.year}: {len(joined)}."
+                f" That is {round(len(joined) / days, 3)} guilds per day."
+            )
+            key = ("growth", start, self.index.generation)
+        else:
+            joined = self.timeline.timestamps
+            rates = {shard: self.shards.join_rate(shard) for shard in self.shards.guilds}
+            description = (
+                f"Total guilds: {len(joined)}.\n"
+                f"Joining {round(sum(rates.values()), 2)} guilds per hour over the last day."
+            )
+            if len(rates) > 1:
+                fastest = sorted(rates.items(), key=lambda item: item[1], reverse=True)[:10]
+                description += "\n\n**Fastest growing shards (guilds / joins per hour):**\n" + "\n".join(
+                    f"{shard}. {ic(self.shards.guilds[shard])} / {round(rate, 2)}" for shard, rate in fastest
+                )
+            key = ("growth", None, self.index.generation)
+
+        png = self.charts.get(key)
+        if png is None:
+            async with ctx.typing():
+                png = await self.charts.render(key, render_growth, joined)
+        e = discord.Embed(color=discord.Color.orange(), description=description)
+        e.set_image(url="attachment://attachment.png")
+        return await ctx.send(embed=e, file=discord.File(io.BytesIO(png), "attachment.png"))
+
+    @gm_root.command(name="export")
+    async def gm_export(self, ctx: commands.Context, fmt: str = "csv", compress: bool = False):
+        """Uploads every guild's id, name, owner, member and bot counts, and join and creation dates.
+
+        `fmt` is `csv` or `jsonl`. Set `compress` to gzip the file, if it would be too big to upload."""
+        fmt = fmt.lower()
+        if fmt not in export.FORMATS:
+            return await ctx.send(f"Format must be one of: {', '.join(export.FORMATS)}.")
+        async with ctx.typing():
+            fp = await export.export(list(self.index.guilds.values()), self.columns, fmt, compress=compress)
+            try:
+                size = fp.seek(0, io.SEEK_END)
+                fp.seek(0)
+                limit = ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024
+                if size > limit:
+                    hint = "" if compress else " Try again with compression."
+                    return await ctx.send(f"The export is {size // 1024}KiB, over the upload limit.{hint}")
+                name = f"guilds.{fmt}" + (".gz" if compress else "")
+                await ctx.send(f"{len(self.index)} guilds.", file=discord.File(fp, name))
+            finally:
+                fp.close()
+
+    @gm_root.command(name="filter", aliases=["list"])
+    @commands.bot_has_permissions(**_PERMS)
+    async def gm_filter(self, ctx: commands.Context, *, query: str):
+        """Lists the guilds matching a filter, e.g. `members>1000 bots/members>0.5 sort:-members limit:50`.
+
+        Terms all have to match. Fields: `owner`, `members`, `bots`, `bots/members`, `joined`, `created`.
+        Operators: `< <= > >= = !=`. `sort:field` sorts ascending, `sort:-field` descending, and `limit:n` keeps the
+        first `n` guilds."""
+        start = time.perf_counter()
+        ids = filters.compile_query(query).run(self.columns)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not ids:
+            return await ctx.send(f"No matches.")
+
+        def fmt(n: int, guild: Optional[discord.Guild]) -> str:
+            if guild is None:
+                return f"{ic(n + 1)}. (left since)"
+            name = guild.name if len(guild.name) <= 80 else guild.name[:77] + "..."
+            row = self.columns.row(guild.id) or {"members": guild.member_count, "bots": "?"}
+            return f"{ic(n + 1)}. {name} (`{guild.id}`): {row['members']} members, {row['bots']} bots"
+
+        # the paginator writes its pages into the description, so the timing goes in the title.
+        e = discord.Embed(title=f"{len(ids)} guilds match (found in {round(elapsed, 2)}ms).")
+        selection = pages.Selection(ids, self.index)
+        paginator = pages.LazyPaginatorInterface(self.bot, pages.GuildPages(selection, fmt), embed=e)
+        await paginator.send_to(ctx.channel)
+
+    @gm_root.command(name="history")
+    async def gm_history(self, ctx: commands.Context, guild: Guild, days: int = 30):
+        """Shows a guild's member count over the last `days` days, sampled hourly.
+
+        Put guild names with spaces in quotes."""
+        guild: discord.Guild
+        timestamps, counts = self.history.series(guild.id, start=time.time() - days * 86400)
+        if len(timestamps) < 2:
+            return await ctx.send("Not enough history for that guild yet.")
+        change = int(counts[-1] - counts[0])
+        description = (
+            f"**{guild.name}** went from {ic(int(counts[0]))} to {ic(int(counts[-1]))} members"
+            f" ({'+' if change >= 0 else ''}{ic(change)}) over {len(timestamps)} samples."
+        )
+        key = ("history", guild.id, days, float(timestamps[-1]))
+        png = self.charts.get(key)
+        if png is None:
+            async with ctx.typing():
+                png = await self.charts.render(key, render_history, timestamps.tolist(), counts.tolist())
+        e = discord.Embed(color=discord.Color.orange(), description=description)
         e.set_image(url="attachment://attachment.png")
-        return await ctx.send(embed=e, file=discord.File(buf, "attachment.png"))
+        return await ctx.send(embed=e, file=discord.File(io.BytesIO(png), "attachment.png"))
+
+    async def _bulk_targets(self, criteria: str) -> typing.List[discord.Guild]:
+        query = filters.compile_query(criteria)
+        if not query.terms:
+            raise commands.BadArgument("An empty filter would match every guild.")
+        guilds = (self.index.get(guild_id) for guild_id in query.run(self.columns))
+        return [g for g in guilds if g is not None]
+
+    async def _bulk_leave(self, guild_id: int):
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            await guild.leave()
+
+    async def _bulk_ban(self, guild_id: int):
+        if guild_id not in self.banned:
+            self.banned.add(guild_id)
+            self.journal.append("ban", id=guild_id)
+        await self._bulk_leave(guild_id)
+
+    async def _bulk_checkpoint(self, guild_ids: typing.List[int]):
+        self._record_bulk_done(guild_ids)
+
+    def _record_bulk_done(self, guild_ids: typing.List[int]):
+        if not guild_ids:
+            return
+        record = {"op": "bulk_done", "ids": guild_ids}
+        apply(self.data, record)
+        self.journal.append(**record)
+
+    async def _run_bulk(self, ctx: commands.Context):
+        job = self.data["bulk_job"]
+        action = self._bulk_ban if job["action"] == "ban" else self._bulk_leave
+        self.bulk = BulkRunner(action, job["pending"], checkpoint=self._bulk_checkpoint)
+        m = await ctx.send(f"Bulk {job['action']}: 0/{self.bulk.total}")
+        self._bulk_task = asyncio.ensure_future(self.bulk.run())
+        try:
+            while not self._bulk_task.done():
+                await asyncio.wait([self._bulk_task], timeout=5)
+                await m.edit(
+                    content=f"Bulk {job['action']}: {self.bulk.done + self.bulk.failed}/{self.bulk.total}"
+                    f" ({self.bulk.failed} failed)"
+                )
+            self._bulk_task.result()
+        except asyncio.CancelledError:
+            return await m.edit(content=m.content + f"\nCancelled. Use `{ctx.prefix}guilds bulk resume` to continue.")
+        finally:
+            self.bulk = self._bulk_task = None
+        self.set_setting("bulk_job", None)
+        await m.edit(content=m.content + "\nDone.")
+
+    async def _start_bulk(self, ctx: commands.Context, action: str, criteria: str):
+        if self._bulk_task is not None:
+            return await ctx.send("A bulk operation is already running.")
+        if self.data.get("bulk_job"):
+            return await ctx.send(
+                f"An interrupted bulk operation is pending. Use `{ctx.prefix}guilds bulk resume` or"
+                f" `{ctx.prefix}guilds bulk cancel` first."
+            )
+        targets = await self._bulk_targets(criteria)
+        if not targets:
+            return await ctx.send("No guilds match.")
+        await ctx.send(f"This will {action} **{len(targets)}** guilds. Continue? (yes/no)")
+        pred = MessagePredicate.yes_or_no(ctx)
+        try:
+            await self.bot.wait_for("message", check=pred, timeout=30)
+        except asyncio.TimeoutError:
+            pred.result = False
+        if not pred.result:
+            return await ctx.send("Cancelled.")
+        self.set_setting("bulk_job", {"action": action, "criteria": criteria, "pending": [g.id for g in targets]})
+        await self._run_bulk(ctx)
+
+    @gm_root.group(name="bulk", invoke_without_command=True)
+    async def gm_bulk(self, ctx: commands.Context, *, criteria: str):
+        """Shows how many guilds match a filter, without doing anything to them.
+
+        Filters are space separated terms that all have to match, e.g. `members<10 bots/members>0.8 joined>2021-01`.
+        Fields: `owner`, `members`, `bots`, `bots/members`, `joined`, `created`. Operators: `< <= > >= = !=`.
+        `sort:field`, `sort:-field` and `limit:n` pick which guilds are affected, see `[p]help guilds filter`."""
+        targets = await self._bulk_targets(criteria)
+        sample = "\n".join(f"{g.name} ({g.id}): {g.member_count}" for g in targets[:10])
+        await ctx.send(f"**{len(targets)}** guilds match." + (f"\n```\n{sample}\n```" if sample else ""))
+
+    @gm_bulk.command(name="leave")
+    async def gm_bulk_leave(self, ctx: commands.Context, *, criteria: str):
+        """Leaves every guild matching a filter. See `[p]help guilds bulk`."""
+        await self._start_bulk(ctx, "leave", criteria)
+
+    @gm_bulk.command(name="ban")
+    async def gm_bulk_ban(self, ctx: commands.Context, *, criteria: str):
+        """Bans and leaves every guild matching a filter. See `[p]help guilds bulk`."""
+        await self._start_bulk(ctx, "ban", criteria)
+
+    @gm_bulk.command(name="resume")
+    async def gm_bulk_resume(self, ctx: commands.Context):
+        """Resumes an interrupted bulk operation."""
+        if self._bulk_task is not None:
+            return await ctx.send("A bulk operation is already running.")
+        if not self.data.get("bulk_job"):
+            return await ctx.send("There is nothing to resume.")
+        await self._run_bulk(ctx)
+
+    @gm_bulk.command(name="cancel")
+    async def gm_bulk_cancel(self, ctx: commands.Context):
+        """Stops a running bulk operation, or discards an interrupted one."""
+        if self._bulk_task is not None:
+            self._bulk_task.cancel()
+            return await ctx.send(f"Stopping. Use `{ctx.prefix}guilds bulk resume` to continue later.")
+        self.set_setting("bulk_job", None)
+        return await ctx.send("Discarded the pending bulk operation.")
 
     @gm_root.command(name="ban")
     async def ban(self, ctx: commands.Context, leave_too: typing.Optional[bool] = False, *, guild: Union[Guild, int]):
@@ -378,12 +1011,11 @@ class GuildManager(commands.Cog):
         # prevent a softlock with no obvious fix to people with less than 1 braincell
         if isinstance(guild, discord.Guild):
             guild = guild.id
-        if not self.data.get("banned"):
-            self.data["banned"] = [guild]
-        else:
-            self.data["banned"].append(guild)
+        if guild not in self.banned:
+            self.banned.add(guild)
+            self.journal.append("ban", id=guild)
         if leave_too:
-            g = bot.get_guild(guild)
+            g = self.bot.get_guild(guild)
             if g is not None:
                 await g.leave()
                 return await ctx.send(f"Banned and left server `{guild}`")
@@ -397,10 +1029,10 @@ class GuildManager(commands.Cog):
         """Unbans a server. See: [p]help guilds ban"""
         if isinstance(guild, discord.Guild):
             guild = guild.id
-        if not self.data.get("banned"):
-            self.data["banned"] = []
-        else:
-            self.data["banned"].remove(guild)
+        if guild not in self.banned:
+            return await ctx.send(f"Server {guild} is not banned.")
+        self.banned.discard(guild)
+        self.journal.append("unban", id=guild)
         return await ctx.send(f"Server {guild} unbanned.")
 
 
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List
+
+import discord
+
+log = logging.getLogger("red.kko-gm-ported.guildmanager.bulk")
+
+
+class BulkRunner:
+    """
+    Runs ``action(guild_id)`` over many guilds with bounded concurrency and a request rate cap.
+
+    discord.py already waits out 429s per route, but leaving guilds shares one bucket on Discord's side that it
+    can't see, so requests are also paced to ``rate`` per second. A 429 that still makes it through puts the id
+    back on the queue after the advertised delay. ``checkpoint(ids)`` is awaited with each batch of finished ids,
+    so an interrupted run can be resumed with only what is left.
+    """
+
+    def __init__(
+        self,
+        action: Callable[[int], Awaitable[None]],
+        guild_ids: Iterable[int],
+        *,
+        checkpoint: Callable[[List[int]], Awaitable[None]],
+        concurrency: int = 2,
+        rate: float = 2.0,
+        batch: int = 25,
+    ):
+        self.action = action
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.interval = 1 / rate
+        self.batch = batch
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self._queue: "asyncio.Queue[int]" = asyncio.Queue()
+        for guild_id in guild_ids:
+            self._queue.put_nowait(guild_id)
+            self.total += 1
+        self._finished: List[int] = []
+        self._next_slot = 0.0
+        self._pace = asyncio.Lock()
+        self._workers: List["asyncio.Future"] = []
+
+    async def run(self):
+        self._workers = workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self._finished:
+                await self.checkpoint(self._finished)
+                self._finished = []
+
+    def stop(self) -> List[int]:
+        """Cancels the workers right away, and returns the finished ids that haven't been checkpointed yet.
+
+        For when the checkpoint has to be written before :meth:`run` gets to unwind, e.g. on cog unload."""
+        for worker in self._workers:
+            worker.cancel()
+        finished, self._finished = self._finished, []
+        return finished
+
+    async def _wait_turn(self):
+        async with self._pace:
+            now = time.monotonic()
+            if self._next_slot > now:
+                await asyncio.sleep(self._next_slot - now)
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+    async def _worker(self):
+        while True:
+            guild_id = await self._queue.get()
+            try:
+                await self._wait_turn()
+                await self.action(guild_id)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = float(e.response.headers.get("Retry-After", 5))
+                    log.warning(f"[GUILDMANAGER] bulk action rate limited, retrying {guild_id} in {retry_after}s")
+                    self._next_slot = time.monotonic() + retry_after
+                    self._queue.put_nowait(guild_id)
+                    continue
+                log.warning(f"[GUILDMANAGER] bulk action failed for {guild_id}: {e}")
+                self.failed += 1
+                self._finished.append(guild_id)
+            except asyncio.CancelledError:
+                # an Exception on 3.7; the guild was never finished, so it must stay pending.
+                raise
+            except Exception as e:
+                log.exception(f"[GUILDMANAGER] bulk action failed for {guild_id}", exc_info=e)
+                self.failed += 1
+                self._finished.append(guild_id)
+            else:
+                self.done += 1
+                self._finished.append(guild_id)
+            finally:
+                self._queue.task_done()
+            if len(self._finished) >= self.batch:
+                finished, self._finished = self._finished, []
+                await self.checkpoint(finished)
@@ -0,0 +1,93 @@
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Hashable, Optional, Sequence
+
+
+def _init_worker():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _new_figure():
+    # a bare Figure with its own canvas never touches pyplot's global state, and is freed with the job.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _to_png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def render_growth(joined: Sequence[float], *, label: str = "Guilds") -> bytes:
+    """Renders a cumulative growth chart from a sorted sequence of epoch timestamps."""
+    fig = _new_figure()
+    ax = fig.add_subplot()
+    ax.grid(True)
+    ax.plot([datetime.utcfromtimestamp(ts) for ts in joined], range(len(joined)), lw=2)
+    fig.autofmt_xdate()
+    ax.set_xlabel("Date")
+    ax.set_ylabel(label)
+    return _to_png(fig)
+
+
+def render_history(timestamps: Sequence[float], counts: Sequence[int], *, label: str = "Members") -> bytes:
+    """Renders a guild's member count over time."""
+    fig = _new_figure()
+    ax = fig.add_subplot()
+    ax.grid(True)
+    ax.step([datetime.utcfromtimestamp(ts) for ts in timestamps], counts, where="post", lw=2)
+    fig.autofmt_xdate()
+    ax.set_xlabel("Date")
+    ax.set_ylabel(label)
+    return _to_png(fig)
+
+
+class ChartRenderer:
+    """
+    Renders charts in a worker process, and keeps the most recent PNGs around.
+
+    Keys should include everything the chart depends on (e.g. the guild index generation), so a cached chart is
+    never stale.
+    """
+
+    def __init__(self, max_cached: int = 16):
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+        return png
+
+    async def render(self, key: Hashable, func: Callable[..., bytes], *args) -> bytes:
+        """Returns the cached PNG for ``key``, or runs ``func(*args)`` in the worker pool to make it."""
+        png = self.get(key)
+        if png is not None:
+            return png
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+        png = await asyncio.get_event_loop().run_in_executor(self._pool, func, *args)
+        self._cache[key] = png
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return png
+
+    def close(self):
+        self._cache.clear()
+        if self._pool is not None:
+            # without waiting, the worker outlives the pool and concurrent.futures' exit hook hangs on it (3.8).
+            # the worker is idle unless a chart is mid-render, so this is short.
+            self._pool.shutdown(wait=True)
+            self._pool = None
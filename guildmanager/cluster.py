@@ -0,0 +1,234 @@
+"""
+Cross-process guild aggregation over a Unix domain socket.
+
+Every cluster (bot process) runs a :class:`ClusterNode`. The first node to come up also hosts the
+:class:`Aggregator` on the socket, and every node - including that one - connects to it as a client. Nodes
+periodically publish a small summary of their guilds, and can fan a query out to every other node, getting back
+whatever answered within the timeout.
+
+Messages are newline-delimited JSON objects. Nothing here touches discord, so it can be exercised with a few plain
+local processes pointed at the same socket path.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+log = logging.getLogger("red.kko-gm-ported.guildmanager.cluster")
+
+Handler = Callable[[str, dict], Awaitable[Any]]
+
+# search results can be a few hundred KiB; the default StreamReader line limit is 64KiB.
+_LIMIT = 4 * 1024 * 1024
+
+
+async def _send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+class Aggregator:
+    """Relays queries between nodes and keeps the latest summary from each."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.summaries: Dict[str, dict] = {}
+        self._nodes: Dict[str, asyncio.StreamWriter] = {}
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._waiters: Dict[int, asyncio.Event] = {}
+        self._expected: Dict[int, int] = {}
+        self._ids = itertools.count()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(self._serve, path=self.path, limit=_LIMIT)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in self._nodes.values():
+            writer.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        cluster = None
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                op = message["op"]
+                if op == "hello":
+                    cluster = message["cluster"]
+                    self._nodes[cluster] = writer
+                elif op == "summary":
+                    self.summaries[cluster] = message["summary"]
+                elif op == "summaries":
+                    await _send(writer, {"op": "reply", "qid": message["qid"], "results": self.summaries})
+                elif op == "query":
+                    asyncio.ensure_future(self._fan_out(cluster, writer, message))
+                elif op == "reply":
+                    self._collect(message)
+        except (ConnectionError, ValueError) as e:
+            log.warning(f"[GUILDMANAGER] cluster {cluster} dropped: {e}")
+        finally:
+            if cluster is not None and self._nodes.get(cluster) is writer:
+                del self._nodes[cluster]
+                self.summaries.pop(cluster, None)
+            writer.close()
+
+    async def _fan_out(self, origin: str, writer: asyncio.StreamWriter, message: dict):
+        qid = next(self._ids)
+        targets = [w for c, w in self._nodes.items() if c != origin]
+        self._pending[qid] = {}
+        self._waiters[qid] = asyncio.Event()
+        self._expected[qid] = len(targets)
+        forward = {"op": "query", "qid": qid, "kind": message["kind"], "args": message["args"]}
+        for target in targets:
+            try:
+                await _send(target, forward)
+            except ConnectionError:
+                self._expected[qid] -= 1
+        try:
+            if self._expected[qid] > 0:
+                await asyncio.wait_for(self._waiters[qid].wait(), timeout=message.get("timeout", 2.0))
+        except asyncio.TimeoutError:
+            pass
+        results = self._pending.pop(qid)
+        del self._waiters[qid], self._expected[qid]
+        try:
+            await _send(writer, {"op": "reply", "qid": message["qid"], "results": results})
+        except ConnectionError:
+            pass
+
+    def _collect(self, message: dict):
+        qid = message["qid"]
+        if qid not in self._pending:
+            return  # timed out already
+        self._pending[qid][message["cluster"]] = message["result"]
+        if len(self._pending[qid]) >= self._expected[qid]:
+            self._waiters[qid].set()
+
+
+class ClusterNode:
+    """
+    One cluster's connection to the aggregator.
+
+    ``handler(kind, args)`` answers queries fanned out by other nodes, and must return something JSON-able.
+    If the aggregator goes away, the node reconnects, hosting a new aggregator itself if nobody else does.
+    """
+
+    def __init__(self, path: str, cluster: str, handler: Handler, *, retry: float = 5.0):
+        self.path = path
+        self.cluster = cluster
+        self.handler = handler
+        self.retry = retry
+        self.aggregator: Optional[Aggregator] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._replies: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def wait_connected(self, timeout: float = 5.0):
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, summary: dict):
+        """Sends this cluster's latest summary to the aggregator."""
+        if self.connected:
+            await _send(self._writer, {"op": "summary", "summary": summary})
+
+    async def summaries(self, timeout: float = 2.0) -> Dict[str, dict]:
+        """Returns the latest summary of every connected cluster, including this one."""
+        return await self._request({"op": "summaries"}, timeout)
+
+    async def query(self, kind: str, args: dict, *, timeout: float = 2.0) -> Dict[str, Any]:
+        """Asks every other cluster the same question, returning ``{cluster: result}`` for those that answered in
+        time."""
+        if not self.connected:
+            return {}
+        return await self._request({"op": "query", "kind": kind, "args": args, "timeout": timeout}, timeout + 1)
+
+    async def _request(self, message: dict, timeout: float) -> dict:
+        if not self.connected:
+            return {}
+        qid = next(self._ids)
+        future = self._replies[qid] = asyncio.get_event_loop().create_future()
+        try:
+            await _send(self._writer, dict(message, qid=qid))
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            return {}
+        finally:
+            self._replies.pop(qid, None)
+
+    async def _connect(self):
+        try:
+            return await asyncio.open_unix_connection(self.path, limit=_LIMIT)
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+        # nobody is listening; take over the socket.
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.aggregator = Aggregator(self.path)
+        await self.aggregator.start()
+        log.info(f"[GUILDMANAGER] cluster {self.cluster} is hosting the aggregator at {self.path}")
+        return await asyncio.open_unix_connection(self.path, limit=_LIMIT)
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self._writer = await self._connect()
+                await _send(self._writer, {"op": "hello", "cluster": self.cluster})
+                self._connected.set()
+                async for line in reader:
+                    await self._dispatch(json.loads(line))
+            except (OSError, ValueError) as e:
+                log.warning(f"[GUILDMANAGER] cluster connection lost ({e}), retrying in {self.retry}s")
+            finally:
+                self._connected.clear()
+                if self._writer is not None:
+                    self._writer.close()
+                if self.aggregator is not None:
+                    await self.aggregator.close()
+                    self.aggregator = None
+            await asyncio.sleep(self.retry)
+
+    async def _dispatch(self, message: dict):
+        if message["op"] == "reply":
+            future = self._replies.get(message["qid"])
+            if future is not None and not future.done():
+                future.set_result(message["results"])
+        elif message["op"] == "query":
+            asyncio.ensure_future(self._answer(message))
+
+    async def _answer(self, message: dict):
+        try:
+            result = await self.handler(message["kind"], message["args"])
+        except Exception as e:
+            log.exception(f"[GUILDMANAGER] failed to answer cluster query {message['kind']}", exc_info=e)
+            result = None
+        await _send(self._writer, {"op": "reply", "qid": message["qid"], "cluster": self.cluster, "result": result})
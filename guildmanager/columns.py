@@ -0,0 +1,157 @@
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import discord
+
+from .helpers import LazyModule
+from .timeline import _epoch
+
+np = LazyModule("numpy")
+
+# column -> array typecode. Shard ``None`` is stored as -1 and an unknown join date as NaN.
+COLUMNS = {
+    "id": "Q",
+    "owner": "Q",
+    "members": "q",
+    "bots": "q",
+    "joined": "d",
+    "created": "d",
+    "shard": "q",
+}
+_DTYPES = {"Q": "uint64", "q": "int64", "d": "float64"}
+
+Views = Dict[str, "np.ndarray"]
+
+
+class GuildColumns:
+    """
+    A columnar snapshot of the bot's guilds: one typed ``array`` per field and one row per guild.
+
+    Rows are updated in place from guild and member events. Removing a guild swaps the last row into its slot, so
+    the columns stay dense. Aggregations run over zero-copy numpy views of the arrays. Those views must not outlive
+    the call that made them, because an array can't grow while a view of it exists.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self.columns: Dict[str, array] = {}
+        self._rows: Dict[int, int] = {}
+        self.rebuild(guilds)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self._rows
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        self._rows = {}
+        for guild in guilds:
+            self.add(guild)
+
+    def add(self, guild: discord.Guild):
+        """Adds a guild, or refreshes its row if it is already there."""
+        joined = guild.me.joined_at if guild.me is not None else None
+        values = (
+            guild.id,
+            guild.owner_id or 0,
+            guild.member_count or 0,
+            sum(1 for m in guild.members if m.bot),
+            _epoch(joined) if joined else float("nan"),
+            _epoch(guild.created_at),
+            -1 if guild.shard_id is None else guild.shard_id,
+        )
+        row = self._rows.get(guild.id)
+        if row is None:
+            self._rows[guild.id] = len(self.columns["id"])
+            for column, value in zip(self.columns.values(), values):
+                column.append(value)
+        else:
+            for column, value in zip(self.columns.values(), values):
+                column[row] = value
+
+    def remove(self, guild_id: int):
+        row = self._rows.pop(guild_id, None)
+        if row is None:
+            return
+        last = len(self.columns["id"]) - 1
+        if row != last:
+            self._rows[self.columns["id"][last]] = row
+        for column in self.columns.values():
+            column[row] = column[last]
+            column.pop()
+
+    def set_owner(self, guild_id: int, owner_id: int):
+        row = self._rows.get(guild_id)
+        if row is not None:
+            self.columns["owner"][row] = owner_id
+
+    def member_changed(self, guild_id: int, *, bot: bool, delta: int):
+        """Adjusts a guild's member (and bot) count by ``delta`` after a member joins (1) or leaves (-1)."""
+        row = self._rows.get(guild_id)
+        if row is not None:
+            self.columns["members"][row] += delta
+            if bot:
+                self.columns["bots"][row] += delta
+
+    def row(self, guild_id: int) -> Optional[Dict[str, float]]:
+        """Returns one guild's values by column name."""
+        row = self._rows.get(guild_id)
+        if row is None:
+            return None
+        return {name: column[row] for name, column in self.columns.items()}
+
+    def evaluate(self, func: Callable[[Views], object]):
+        """
+        Calls ``func`` with numpy views of every column, returning what it returns.
+
+        ``func`` must return plain Python values or copies, never the views themselves or slices of them.
+        """
+        views = {name: np.frombuffer(column, dtype=_DTYPES[column.typecode]) for name, column in self.columns.items()}
+        try:
+            return func(views)
+        finally:
+            views.clear()
+
+    def select(
+        self,
+        mask: Optional[Callable[[Views], "np.ndarray"]] = None,
+        *,
+        order: Union[str, Callable[[Views], "np.ndarray"], None] = None,
+        descending: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Returns the ids of the guilds where ``mask(views)`` is True.
+
+        ``order`` sorts the result, by a column name or by an expression over the views.
+        """
+
+        def run(views: Views) -> List[int]:
+            rows = np.flatnonzero(mask(views)) if mask is not None else np.arange(len(views["id"]))
+            if order is not None:
+                keys = (order(views) if callable(order) else views[order])[rows]
+                ranked = np.argsort(keys, kind="stable")
+                rows = rows[ranked[::-1] if descending else ranked]
+            if limit is not None:
+                rows = rows[:limit]
+            return views["id"][rows].tolist()
+
+        return self.evaluate(run)
+
+    def summary(self) -> Dict[str, float]:
+        """Totals and distribution figures for the guild embed."""
+
+        def run(views: Views) -> Dict[str, float]:
+            members, bots = views["members"], views["bots"]
+            if not len(members):
+                return {"members": 0, "bots": 0, "median": 0.0, "largest": 0, "bot_heavy": 0}
+            return {
+                "members": int(members.sum()),
+                "bots": int(bots.sum()),
+                "median": float(np.median(members)),
+                "largest": int(members.max()),
+                "bot_heavy": int(np.count_nonzero(bots * 2 > members)),
+            }
+
+        return self.evaluate(run)
@@ -0,0 +1,116 @@
+import functools
+import operator
+import re
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from redbot.core import commands
+
+from .columns import GuildColumns, Views, np
+
+_OPS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "=": operator.eq,
+}
+_TERM = re.compile(r"^(?P<field>[a-z_/]+)(?P<op><=|>=|!=|<|>|=)(?P<value>.+)$")
+_SORT = re.compile(r"^sort:(?P<descending>-?)(?P<field>[a-z_/]+)$")
+_LIMIT = re.compile(r"^limit:(?P<limit>\d+)$")
+
+
+def _parse_date(value: str) -> float:
+    for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+    raise commands.BadArgument(f"`{value}` is not a date (try YYYY-MM-DD, YYYY-MM or YYYY).")
+
+
+# field -> (column expression over the guild columns, value parser)
+FIELDS: Dict[str, Tuple[Callable[[Views], "np.ndarray"], Callable[[str], float]]] = {
+    "owner": (lambda v: v["owner"], int),
+    "members": (lambda v: v["members"], int),
+    "bots": (lambda v: v["bots"], int),
+    "bots/members": (lambda v: v["bots"] / np.maximum(v["members"], 1), float),
+    "joined": (lambda v: v["joined"], _parse_date),
+    "created": (lambda v: v["created"], _parse_date),
+}
+
+
+class Term(NamedTuple):
+    field: str
+    op: str
+    value: float
+
+
+class Query(NamedTuple):
+    """A parsed filter: terms that all have to match, plus an optional sort and limit."""
+
+    terms: Tuple[Term, ...]
+    sort: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = None
+
+    def mask(self, views: Views) -> "np.ndarray":
+        result = np.ones(len(views["id"]), dtype=bool)
+        for field, op, value in self.terms:
+            result &= _OPS[op](FIELDS[field][0](views), value)
+        return result
+
+    def run(self, columns: GuildColumns) -> List[int]:
+        """Returns the ids of the matching guilds, sorted and limited as asked."""
+
+        def sort_key(views: Views) -> "np.ndarray":
+            return FIELDS[self.sort][0](views)
+
+        return columns.select(
+            self.mask if self.terms else None,
+            order=sort_key if self.sort else None,
+            descending=self.descending,
+            limit=self.limit,
+        )
+
+
+def parse(text: str) -> Query:
+    """
+    Parses a guild filter, e.g. ``members>1000 bots/members>0.5 joined<2021-01 sort:-members limit:50``.
+
+    Terms are separated by spaces and all have to match. Fields are ``owner``, ``members``, ``bots``,
+    ``bots/members``, ``joined`` and ``created``; operators are ``< <= > >= = !=``. ``sort:field`` sorts by a field
+    (``sort:-field`` for descending) and ``limit:n`` keeps the first ``n`` matches.
+    """
+    terms, sort, descending, limit = [], None, False, None
+    for raw in text.lower().split():
+        match = _SORT.match(raw)
+        if match is not None:
+            if match["field"] not in FIELDS:
+                raise commands.BadArgument(f"Can't sort by `{match['field']}`.")
+            sort, descending = match["field"], bool(match["descending"])
+            continue
+        match = _LIMIT.match(raw)
+        if match is not None:
+            limit = int(match["limit"])
+            continue
+        match = _TERM.match(raw)
+        if match is None or match["field"] not in FIELDS:
+            raise commands.BadArgument(f"Invalid filter term `{raw}`.")
+        try:
+            value = FIELDS[match["field"]][1](match["value"])
+        except ValueError:
+            raise commands.BadArgument(f"Invalid value in filter term `{raw}`.")
+        terms.append(Term(match["field"], match["op"], value))
+    return Query(tuple(terms), sort, descending, limit)
+
+
+@functools.lru_cache(maxsize=128)
+def _compile(text: str) -> Query:
+    return parse(text)
+
+
+def compile_query(text: str) -> Query:
+    """:func:`parse`, cached on the normalized query text."""
+    return _compile(" ".join(text.lower().split()))
@@ -1,22 +1,86 @@
-import subprocess
+import functools
+import importlib
+import os
+import re
+import types
 
 from discord.ext import commands
 from discord.ext.commands import Converter
 
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-def get_git_commit():
-    string = ""
+
+def _read(path: str) -> str:
+    with open(path) as rfile:
+        return rfile.read().strip()
+
+
+def _resolve_ref(git_dir: str, ref: str) -> str:
     try:
-        p = subprocess.Popen(["git", "rev-list", "--count", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = p.communicate()
-        if out:
-            string += out.decode("utf-8").strip()
-        p = subprocess.Popen(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = p.communicate()
-        if out:
-            string += "+g" + out.decode("utf-8").strip()
-    finally:
-        return string
+        return _read(os.path.join(git_dir, *ref.split("/")))
+    except OSError:
+        pass
+    with open(os.path.join(git_dir, "packed-refs")) as rfile:
+        for line in rfile:
+            sha, _, name = line.strip().partition(" ")
+            if name == ref:
+                return sha
+    raise LookupError(ref)
+
+
+def _head_commit(root: str = _ROOT) -> str:
+    """Reads the checked out commit straight out of .git, without spawning git."""
+    git_dir = os.path.join(root, ".git")
+    if os.path.isfile(git_dir):  # worktrees and submodules
+        git_dir = os.path.join(root, _read(git_dir).partition("gitdir:")[2].strip())
+    head = _read(os.path.join(git_dir, "HEAD"))
+    if head.startswith("ref:"):
+        # a linked worktree only keeps its own HEAD; branches and packed-refs live in the main repository.
+        try:
+            git_dir = os.path.join(git_dir, _read(os.path.join(git_dir, "commondir")))
+        except OSError:
+            pass
+        head = _resolve_ref(git_dir, head[4:].strip())
+    return head
+
+
+def _stamped_commit(root: str = _ROOT) -> str:
+    """Reads the commit stamped into vers.ion at build time."""
+    match = re.search(r"[0-9a-f]{40}", _read(os.path.join(root, "vers.ion")))
+    if match is None:
+        raise LookupError("vers.ion")
+    return match.group(0)
+
+
+@functools.lru_cache(maxsize=None)
+def get_git_commit():
+    """Returns the local version suffix (``+g<short sha>``), or an empty string if it can't be found.
+
+    Resolved from .git, falling back to the vers.ion stamp. The result is cached."""
+    for source in (_head_commit, _stamped_commit):
+        try:
+            return "+g" + source()[:7]
+        except (OSError, LookupError):
+            continue
+    return ""
+
+
+class LazyModule(types.ModuleType):
+    """
+    A stand-in for a module that is only imported the first time one of its attributes is used.
+
+    This keeps heavy dependencies that only a command or two need (jishaku's paginators, numpy) off the cog's
+    load/reload path.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, item):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, item)
 
 
 class Guild(Converter):
@@ -27,10 +91,20 @@ class Guild(Converter):
         1. name in guild name or guild name in name
         2. guild id = provided argument
         3. channel id in guild
+
+    If the GuildManager cog is loaded, its :class:`~guildmanager.index.GuildIndex` is used instead of walking
+    every guild. That checks ids before names, prefers the longest guild name found in the argument, and falls back
+    to fuzzy matching for an argument in the middle of a guild name (see :meth:`~guildmanager.index.GuildIndex.find`).
     """
 
     async def convert(self, ctx, argument):
         """Converts into a discord.Guild."""
+        index = getattr(ctx.bot.get_cog("GuildManager"), "index", None)
+        if index is not None:
+            guild = index.find(argument)
+            if guild is None:
+                raise commands.BadArgument(f'Unable to convert "{argument}" to discord.Guild.')
+            return guild
         for guild in ctx.bot.guilds:
             if guild.name.lower() in argument.lower() or argument.lower() in guild.name.lower():
                 return guild
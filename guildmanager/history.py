@@ -0,0 +1,266 @@
+"""
+Per-guild member count history, kept in memory-mapped segment files.
+
+A segment holds up to ``capacity`` samples for a fixed number of guild slots. Each slot's count is stored once as
+a base, and after that as one int16 delta per sample. 100k guilds therefore cost about 200KB per sample, or
+roughly 5MB a day when sampled hourly. A guild's history in a segment is one strided column of the delta matrix,
+read straight out of the mapping without copying.
+
+A new segment is started when the current one is full, when it has no free slots left for newly joined guilds, or
+when a count moves by more than an int16 can hold between two samples. Whole segments are deleted once they fall
+out of the retention window.
+"""
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .helpers import LazyModule
+
+np = LazyModule("numpy")
+
+_MAGIC = b"GMH1"
+# magic, slots, capacity, frames, started
+_HEADER = struct.Struct("<4sIIId")
+_FRAMES = struct.Struct("<I")
+_FRAMES_AT = 12
+# marks a guild the bot wasn't in when the sample was taken.
+ABSENT = -32768
+_MAX_DELTA = 32767
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _started(path: str) -> float:
+    return int(os.path.basename(path)[: -len(".gmh")]) / 1000
+
+
+class Segment:
+    """One segment file. Views of its columns are only valid until it is closed."""
+
+    def __init__(self, path: str, writable: bool = False):
+        self.path = path
+        self._file = open(path, "r+b" if writable else "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, self.slots, self.capacity, self.frames, self.started = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a member history segment")
+        self._ids_at = _align(_HEADER.size)
+        self._base_at = self._ids_at + 8 * self.slots
+        self._times_at = _align(self._base_at + 4 * self.slots)
+        self._deltas_at = self._times_at + 8 * self.capacity
+        ids = self.ids()
+        self.assigned = int(np.count_nonzero(ids))
+        self._slot_of: Dict[int, int] = {guild_id: slot for slot, guild_id in enumerate(ids[: self.assigned].tolist())}
+        del ids
+
+    @staticmethod
+    def size(slots: int, capacity: int) -> int:
+        return _align(_align(_HEADER.size) + 12 * slots) + 8 * capacity + 2 * slots * capacity
+
+    @classmethod
+    def create(cls, path: str, slots: int, capacity: int, started: float) -> "Segment":
+        with open(path, "wb") as fp:
+            fp.write(_HEADER.pack(_MAGIC, slots, capacity, 0, started))
+            # sparse on most filesystems: unwritten samples take no space on disk.
+            fp.truncate(cls.size(slots, capacity))
+        return cls(path, writable=True)
+
+    def ids(self) -> "np.ndarray":
+        return np.frombuffer(self._map, dtype=np.uint64, count=self.slots, offset=self._ids_at)
+
+    def base(self) -> "np.ndarray":
+        return np.frombuffer(self._map, dtype=np.int32, count=self.slots, offset=self._base_at)
+
+    def times(self) -> "np.ndarray":
+        return np.frombuffer(self._map, dtype=np.float64, count=self.frames, offset=self._times_at)
+
+    def deltas(self) -> "np.ndarray":
+        """The ``(frames, slots)`` delta matrix."""
+        matrix = np.frombuffer(self._map, dtype=np.int16, count=self.frames * self.slots, offset=self._deltas_at)
+        return matrix.reshape(self.frames, self.slots)
+
+    def slot(self, guild_id: int) -> Optional[int]:
+        return self._slot_of.get(guild_id)
+
+    def assign(self, guild_id: int, base: int = 0) -> Optional[int]:
+        """Gives a guild the next free slot. Returns None if there is none left."""
+        if self.assigned >= self.slots:
+            return None
+        slot = self._slot_of[guild_id] = self.assigned
+        struct.pack_into("<Q", self._map, self._ids_at + 8 * slot, guild_id)
+        struct.pack_into("<i", self._map, self._base_at + 4 * slot, base)
+        self.assigned += 1
+        return slot
+
+    def append(self, timestamp: float, frame: "np.ndarray"):
+        """Writes one sample of per-slot deltas."""
+        struct.pack_into("<d", self._map, self._times_at + 8 * self.frames, timestamp)
+        start = self._deltas_at + 2 * self.slots * self.frames
+        self._map[start : start + 2 * self.slots] = frame.astype(np.int16).tobytes()
+        self.frames += 1
+        # the frame count goes last, so a crash mid-write just loses the sample.
+        _FRAMES.pack_into(self._map, _FRAMES_AT, self.frames)
+
+    def counts(self) -> "np.ndarray":
+        """Every slot's count as of the latest sample, as a new int64 array."""
+        deltas = self.deltas()
+        result = self.base().astype(np.int64) + np.where(deltas == ABSENT, 0, deltas).sum(axis=0, dtype=np.int64)
+        del deltas
+        return result
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # a view is still alive somewhere; the mapping goes away with it.
+        self._file.close()
+
+
+class MemberHistory:
+    """
+    Samples of every guild's member count over time, in ``directory``.
+
+    Keeps ``retention`` seconds of samples, in segments of ``capacity`` samples (a week of hourly samples by default).
+    Each new segment leaves ``slack`` of its slots free for guilds the bot joins later.
+    """
+
+    def __init__(self, directory: str, *, capacity: int = 168, retention: float = 30 * 86400.0, slack: float = 0.01):
+        self.directory = directory
+        self.capacity = capacity
+        self.retention = retention
+        self.slack = slack
+        self._current: Optional[Segment] = None
+        self._last: Optional["np.ndarray"] = None
+        self._readers: Dict[str, Segment] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._resume()
+
+    def segments(self) -> List[str]:
+        """Segment paths, oldest first."""
+        return sorted(os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".gmh"))
+
+    @property
+    def disk_usage(self) -> int:
+        """Bytes actually allocated on disk."""
+        total = 0
+        for path in self.segments():
+            st = os.stat(path)
+            total += getattr(st, "st_blocks", st.st_size // 512) * 512
+        return total
+
+    def _resume(self):
+        paths = self.segments()
+        if not paths:
+            return
+        try:
+            segment = Segment(paths[-1], writable=True)
+        except (OSError, ValueError, struct.error):
+            return
+        if segment.frames >= segment.capacity:
+            return segment.close()
+        self._current = segment
+        self._last = segment.counts()
+
+    def _roll(self, guild_ids: Sequence[int], counts: "np.ndarray", timestamp: float):
+        if self._current is not None:
+            self._current.close()
+        slots = len(guild_ids) + int(len(guild_ids) * self.slack) + 64
+        path = os.path.join(self.directory, f"{int(timestamp * 1000):015d}.gmh")
+        self._current = segment = Segment.create(path, slots, self.capacity, timestamp)
+        for guild_id, count in zip(guild_ids, counts.tolist()):
+            segment.assign(guild_id, count)
+        self._last = np.zeros(slots, dtype=np.int64)
+        self._last[: len(guild_ids)] = counts
+        frame = np.full(slots, ABSENT, dtype=np.int16)
+        frame[: len(guild_ids)] = 0
+        segment.append(timestamp, frame)
+
+    def record(self, guild_ids: Sequence[int], counts: Sequence[int], timestamp: Optional[float] = None):
+        """Appends one sample of ``counts[i]`` members for ``guild_ids[i]``."""
+        timestamp = time.time() if timestamp is None else timestamp
+        guild_ids = [int(guild_id) for guild_id in guild_ids]
+        counts = np.asarray(counts, dtype=np.int64)
+        segment = self._current
+        if segment is None or segment.frames >= segment.capacity:
+            return self._roll(guild_ids, counts, timestamp)
+        slots = np.empty(len(guild_ids), dtype=np.int64)
+        for i, guild_id in enumerate(guild_ids):
+            slot = segment.slot(guild_id)
+            if slot is None:
+                slot = segment.assign(guild_id)
+                if slot is None:
+                    return self._roll(guild_ids, counts, timestamp)
+            slots[i] = slot
+        deltas = counts - self._last[slots]
+        if len(deltas) and np.abs(deltas).max() > _MAX_DELTA:
+            return self._roll(guild_ids, counts, timestamp)
+        frame = np.full(segment.slots, ABSENT, dtype=np.int16)
+        frame[slots] = deltas
+        segment.append(timestamp, frame)
+        self._last[slots] = counts
+
+    def _open(self, path: str) -> Segment:
+        if self._current is not None and self._current.path == path:
+            return self._current
+        segment = self._readers.get(path)
+        if segment is None:
+            segment = self._readers[path] = Segment(path)
+        return segment
+
+    def series(
+        self, guild_id: int, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Returns ``(timestamps, member counts)`` of a guild's samples between ``start`` and ``end``."""
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        paths = self.segments()
+        # segments are named by when they started, so one ends where the next begins.
+        ends = [_started(path) for path in paths[1:]] + [np.inf]
+        times_parts, count_parts = [], []
+        for path, segment_end in zip(paths, ends):
+            if _started(path) >= end or segment_end < start:
+                continue
+            segment = self._open(path)
+            slot = segment.slot(guild_id)
+            if slot is None:
+                continue
+            times = segment.times()
+            column = segment.deltas()[:, slot]
+            present = column != ABSENT
+            counts = int(segment.base()[slot]) + np.cumsum(np.where(present, column, 0), dtype=np.int64)
+            keep = present & (times >= start) & (times < end)
+            times_parts.append(times[keep])
+            count_parts.append(counts[keep])
+            del times, column
+        if not times_parts:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)
+        return np.concatenate(times_parts), np.concatenate(count_parts)
+
+    def prune(self, now: Optional[float] = None):
+        """Deletes segments whose every sample is older than the retention window."""
+        cutoff = (time.time() if now is None else now) - self.retention
+        paths = self.segments()
+        for path, following in zip(paths, paths[1:]):
+            if _started(following) >= cutoff:
+                break
+            segment = self._readers.pop(path, None)
+            if segment is not None:
+                segment.close()
+            os.unlink(path)
+
+    def close(self):
+        for segment in self._readers.values():
+            segment.close()
+        self._readers.clear()
+        if self._current is not None:
+            self._current.flush()
+            self._current.close()
+            self._current = None
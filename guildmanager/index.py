@@ -0,0 +1,397 @@
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Union
+
+import discord
+
+
+def normalize(name: str) -> str:
+    """Normalizes a guild name for lookups."""
+    return " ".join(name.casefold().split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Returns the character trigrams of an already normalized string, padded so short strings still have some."""
+    padded = f"  {text} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+class TrigramIndex:
+    """
+    An inverted index of name trigrams -> ids, for ranked fuzzy search.
+
+    A query only touches the posting lists of its own trigrams, so its cost depends on how common those trigrams
+    are rather than on how many names are indexed.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self._grams: Dict[int, FrozenSet[str]] = {}
+
+    def __len__(self):
+        return len(self._grams)
+
+    def clear(self):
+        self.postings.clear()
+        self._grams.clear()
+
+    def add(self, key: int, name: str):
+        self.remove(key)
+        grams = self._grams[key] = trigrams(normalize(name))
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: int):
+        for gram in self._grams.pop(key, ()):
+            posting = self.postings[gram]
+            posting.discard(key)
+            if not posting:
+                del self.postings[gram]
+
+    def search(self, query: str, limit: int = 10, *, threshold: float = 0.3) -> List[Tuple[int, float, float]]:
+        """
+        Returns up to ``limit`` ``(id, containment, similarity)`` triples, best first.
+
+        Results are ranked by containment (how much of the query they contain), then by the Dice similarity of the
+        whole name. Results from several indexes merge into the same order by sorting on ``(containment,
+        similarity)``. Anything containing less than ``threshold`` of the query is dropped.
+        """
+        grams = trigrams(normalize(query))
+        if not grams:
+            return []
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for key in self.postings.get(gram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        minimum = threshold * len(grams)
+        ranked = heapq.nlargest(
+            limit,
+            (
+                (count / len(grams), 2 * count / (len(grams) + len(self._grams[key])), key)
+                for key, count in shared.items()
+                if count >= minimum
+            ),
+        )
+        return [(key, containment, dice) for containment, dice, key in ranked]
+
+
+class GuildIndex:
+    """
+    An incrementally maintained lookup index over the bot's guilds.
+
+    Holds:
+        * guild id -> guild
+        * channel id -> guild id
+        * normalized name -> guild ids, plus a sorted name list for prefix lookups
+        * a :class:`TrigramIndex` over guild names, for ranked fuzzy search
+        * an indexable list of guild ids (``order``), for paging without copying ``bot.guilds``
+
+    The owning cog keeps this current from its guild/channel listeners, and rebuilds it on ready.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self.guilds: Dict[int, discord.Guild] = {}
+        self.channels: Dict[int, int] = {}
+        self.names: Dict[str, Set[int]] = {}
+        self.trigrams = TrigramIndex()
+        self._sorted_names: List[Tuple[str, int]] = []
+        # normalized name length -> how many distinct names have it, so contained() only slices lengths that exist.
+        self._name_lengths: Dict[int, int] = {}
+        self.order: List[int] = []
+        self._slots: Dict[int, int] = {}
+        self.generation = 0
+        self.rebuild(guilds)
+
+    def __len__(self):
+        return len(self.guilds)
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self.guilds
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        """Drops everything and indexes ``guilds`` from scratch."""
+        self.guilds.clear()
+        self.channels.clear()
+        self.names.clear()
+        self.trigrams.clear()
+        self._sorted_names = []
+        self._name_lengths.clear()
+        self.order = []
+        self._slots.clear()
+        for guild in guilds:
+            self._add(guild)
+        self._sorted_names.sort()
+        self.generation += 1
+
+    def add(self, guild: discord.Guild):
+        """Adds (or replaces) a guild."""
+        if guild.id in self.guilds:
+            self._remove(guild.id, keep_slot=True)
+        self._add(guild, keep_sorted=True)
+        self.generation += 1
+
+    def remove(self, guild: discord.Guild):
+        """Removes a guild and all of its channels."""
+        if guild.id in self.guilds:
+            self._remove(guild.id)
+            self.generation += 1
+
+    def rename(self, before: discord.Guild, after: discord.Guild):
+        """Updates the name entries of a guild, if its name changed."""
+        if before.name != after.name:
+            self._drop_name(before.name, before.id)
+            self._add_name(after.name, after.id, keep_sorted=True)
+        self.guilds[after.id] = after
+
+    def add_channel(self, channel: discord.abc.GuildChannel):
+        self.channels[channel.id] = channel.guild.id
+
+    def remove_channel(self, channel: discord.abc.GuildChannel):
+        self.channels.pop(channel.id, None)
+
+    def get(self, guild_id: int) -> Optional[discord.Guild]:
+        return self.guilds.get(guild_id)
+
+    def at(self, position: int) -> discord.Guild:
+        """Returns the guild at ``position`` in :attr:`order`."""
+        return self.guilds[self.order[position]]
+
+    def by_channel(self, channel_id: int) -> Optional[discord.Guild]:
+        guild_id = self.channels.get(channel_id)
+        return self.guilds.get(guild_id) if guild_id is not None else None
+
+    def by_name(self, name: str) -> Optional[discord.Guild]:
+        """Returns a guild whose name is ``name``, or starts with it."""
+        name = normalize(name)
+        ids = self.names.get(name)
+        if ids:
+            return self.guilds[next(iter(ids))]
+        i = bisect_left(self._sorted_names, (name,))
+        if i < len(self._sorted_names) and self._sorted_names[i][0].startswith(name):
+            return self.guilds[self._sorted_names[i][1]]
+        return None
+
+    def contained(self, text: str) -> Optional[discord.Guild]:
+        """Returns the guild with the longest name that appears somewhere in ``text``."""
+        text = normalize(text)
+        for length in sorted((n for n in self._name_lengths if n <= len(text)), reverse=True):
+            for start in range(len(text) - length + 1):
+                ids = self.names.get(text[start : start + length])
+                if ids:
+                    return self.guilds[next(iter(ids))]
+        return None
+
+    def find(self, argument: str) -> Optional[discord.Guild]:
+        """
+        Resolves ``argument`` the same way the :class:`Guild` converter does:
+
+            1. guild id
+            2. channel id
+            3. exact or prefix name match
+            4. a guild name contained in ``argument``, longest first
+            5. the best fuzzy name match
+        """
+        if argument.isdigit():
+            snowflake = int(argument)
+            guild = self.get(snowflake) or self.by_channel(snowflake)
+            if guild is not None:
+                return guild
+        guild = self.by_name(argument) or self.contained(argument)
+        if guild is not None:
+            return guild
+        matches = self.trigrams.search(argument, 1, threshold=0.6)
+        return self.guilds[matches[0][0]] if matches else None
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[discord.Guild, float, float]]:
+        """Returns up to ``limit`` ``(guild, containment, similarity)`` triples whose names best match ``query``."""
+        return [(self.guilds[key], *rank) for key, *rank in self.trigrams.search(query, limit)]
+
+    def _add(self, guild: discord.Guild, *, keep_sorted: bool = False):
+        if guild.id not in self._slots:
+            self._slots[guild.id] = len(self.order)
+            self.order.append(guild.id)
+        self.guilds[guild.id] = guild
+        for channel in guild.channels:
+            self.channels[channel.id] = guild.id
+        self._add_name(guild.name, guild.id, keep_sorted=keep_sorted)
+
+    def _remove(self, guild_id: int, *, keep_slot: bool = False):
+        guild = self.guilds.pop(guild_id)
+        if not keep_slot:
+            # swap the last guild into the freed slot, so removal stays O(1).
+            slot = self._slots.pop(guild_id)
+            last = self.order.pop()
+            if last != guild_id:
+                self.order[slot] = last
+                self._slots[last] = slot
+        for channel in guild.channels:
+            self.channels.pop(channel.id, None)
+        self._drop_name(guild.name, guild_id)
+
+    def _add_name(self, name: str, guild_id: int, *, keep_sorted: bool):
+        self.trigrams.add(guild_id, name)
+        name = normalize(name)
+        if name not in self.names:
+            self.names[name] = set()
+            self._name_lengths[len(name)] = self._name_lengths.get(len(name), 0) + 1
+        self.names[name].add(guild_id)
+        if keep_sorted:
+            insort(self._sorted_names, (name, guild_id))
+        else:
+            self._sorted_names.append((name, guild_id))
+
+    def _drop_name(self, name: str, guild_id: int):
+        self.trigrams.remove(guild_id)
+        name = normalize(name)
+        ids = self.names.get(name)
+        if ids is not None:
+            ids.discard(guild_id)
+            if not ids:
+                del self.names[name]
+                self._name_lengths[len(name)] -= 1
+                if not self._name_lengths[len(name)]:
+                    del self._name_lengths[len(name)]
+        i = bisect_left(self._sorted_names, (name, guild_id))
+        if i < len(self._sorted_names) and self._sorted_names[i] == (name, guild_id):
+            del self._sorted_names[i]
+
+
+class OwnerIndex:
+    """
+    Tracks which guilds each user owns.
+
+    Owners are also bucketed by how many guilds they own, with the distinct counts kept sorted, so the top ``k``
+    owners can be read off without counting or sorting every owner.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self.owner_of: Dict[int, int] = {}
+        self.owned: Dict[int, Set[int]] = {}
+        self._by_count: Dict[int, Set[int]] = {}
+        self._counts: List[int] = []
+        self.rebuild(guilds)
+
+    def __len__(self):
+        return len(self.owner_of)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self.owner_of = {g.id: g.owner_id for g in guilds}
+        self.owned = {}
+        for guild_id, owner_id in self.owner_of.items():
+            self.owned.setdefault(owner_id, set()).add(guild_id)
+        self._by_count = {}
+        for owner_id, owned in self.owned.items():
+            self._by_count.setdefault(len(owned), set()).add(owner_id)
+        self._counts = sorted(self._by_count)
+
+    def add(self, guild: discord.Guild):
+        if self.owner_of.get(guild.id) == guild.owner_id:
+            return
+        self.remove(guild.id)
+        self.owner_of[guild.id] = guild.owner_id
+        owned = self.owned.setdefault(guild.owner_id, set())
+        self._move(guild.owner_id, len(owned), len(owned) + 1)
+        owned.add(guild.id)
+
+    def remove(self, guild_id: int):
+        owner_id = self.owner_of.pop(guild_id, None)
+        if owner_id is None:
+            return
+        owned = self.owned[owner_id]
+        owned.discard(guild_id)
+        self._move(owner_id, len(owned) + 1, len(owned))
+        if not owned:
+            del self.owned[owner_id]
+
+    def guilds_of(self, owner_id: int) -> Set[int]:
+        """Returns the IDs of the guilds ``owner_id`` owns."""
+        return self.owned.get(owner_id, set())
+
+    def top(self, k: int = 10) -> List[Tuple[int, int]]:
+        """Returns up to ``k`` ``(owner id, guilds owned)`` pairs, most guilds first."""
+        result = []
+        for count in reversed(self._counts):
+            for owner_id in self._by_count[count]:
+                if len(result) == k:
+                    return result
+                result.append((owner_id, count))
+        return result
+
+    def _move(self, owner_id: int, old: int, new: int):
+        if old:
+            bucket = self._by_count[old]
+            bucket.discard(owner_id)
+            if not bucket:
+                del self._by_count[old]
+                del self._counts[bisect_left(self._counts, old)]
+        if new:
+            if new not in self._by_count:
+                self._by_count[new] = set()
+                insort(self._counts, new)
+            self._by_count[new].add(owner_id)
+
+
+class MemberIndex:
+    """
+    A reverse user id -> guild ids index.
+
+    Most users only share one guild with the bot, so those are stored as a bare int; anyone in more is stored as a
+    sorted ``array('Q')`` of guild ids, which keeps memory flat on large bots.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self._guilds: Dict[int, Union[int, array]] = {}
+        self.rebuild(guilds)
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self._guilds = {}
+        for guild in guilds:
+            self.add_guild(guild)
+
+    def add_guild(self, guild: discord.Guild):
+        """Indexes every cached member of ``guild``. Also used after a chunk."""
+        for member in guild.members:
+            self.add(member.id, guild.id)
+
+    def remove_guild(self, guild: discord.Guild):
+        for member in guild.members:
+            self.remove(member.id, guild.id)
+
+    def add(self, user_id: int, guild_id: int):
+        current = self._guilds.get(user_id)
+        if current is None:
+            self._guilds[user_id] = guild_id
+        elif isinstance(current, int):
+            if current != guild_id:
+                self._guilds[user_id] = array("Q", sorted((current, guild_id)))
+        else:
+            i = bisect_left(current, guild_id)
+            if i == len(current) or current[i] != guild_id:
+                current.insert(i, guild_id)
+
+    def remove(self, user_id: int, guild_id: int):
+        current = self._guilds.get(user_id)
+        if current is None:
+            return
+        if isinstance(current, int):
+            if current == guild_id:
+                del self._guilds[user_id]
+            return
+        i = bisect_left(current, guild_id)
+        if i < len(current) and current[i] == guild_id:
+            del current[i]
+            if len(current) == 1:
+                self._guilds[user_id] = current[0]
+
+    def mutual_guilds(self, user_id: int) -> Tuple[int, ...]:
+        """Returns the IDs of every guild the bot shares with ``user_id``."""
+        current = self._guilds.get(user_id)
+        if current is None:
+            return ()
+        if isinstance(current, int):
+            return (current,)
+        return tuple(current)
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+
+class InviteCache:
+    """Per-guild ``(description, url)`` invites, each kept until its TTL runs out or the invite is deleted."""
+
+    def __init__(self):
+        self._invites: Dict[int, Tuple[str, str, float]] = {}
+
+    def get(self, guild_id: int) -> Optional[Tuple[str, str]]:
+        cached = self._invites.get(guild_id)
+        if cached is None:
+            return None
+        if cached[2] < time.monotonic():
+            del self._invites[guild_id]
+            return None
+        return cached[0], cached[1]
+
+    def put(self, guild_id: int, description: str, url: str, ttl: float):
+        self._invites[guild_id] = (description, url, time.monotonic() + ttl)
+
+    def drop(self, guild_id: int, url: Optional[str] = None):
+        """Forgets a guild's invite. If ``url`` is given, only if it is the cached one."""
+        cached = self._invites.get(guild_id)
+        if cached is not None and (url is None or cached[1] == url):
+            del self._invites[guild_id]
+
+
+def invite_channels(guild: discord.Guild) -> Iterable[discord.TextChannel]:
+    """The text channels the bot is allowed to create invites in."""
+    me = guild.me
+    return (c for c in guild.text_channels if c.permissions_for(me).create_instant_invite)
+
+
+async def create_first(channels: Iterable[discord.abc.GuildChannel], *, concurrency: int = 2, **kwargs):
+    """
+    Tries ``create_invite(**kwargs)`` on up to ``concurrency`` channels at a time, returning the first invite made.
+
+    Attempts still in flight once one succeeds can't be taken back, so they are left to finish and any invite they
+    make is deleted again. Returns None if every channel failed.
+    """
+    channels = iter(channels)
+    running = set()
+
+    def launch():
+        for channel in channels:
+            running.add(asyncio.ensure_future(channel.create_invite(**kwargs)))
+            return
+
+    for _ in range(concurrency):
+        launch()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                running.discard(task)
+                if task.exception() is None:
+                    # anything else that finished in the same wakeup gets discarded with the rest.
+                    running.update(done - {task})
+                    return task.result()
+                if not isinstance(task.exception(), discord.HTTPException):
+                    raise task.exception()
+                launch()
+        return None
+    finally:
+        if running:
+            asyncio.ensure_future(_discard(running, kwargs.get("reason")))
+
+
+async def _discard(tasks: Iterable["asyncio.Future"], reason: Optional[str]):
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, discord.Invite):
+            try:
+                await result.delete(reason=reason)
+            except discord.HTTPException:
+                pass
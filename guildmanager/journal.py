@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+from typing import Optional
+
+log = logging.getLogger("red.kko-gm-ported.guildmanager.journal")
+
+
+def apply(data: dict, record: dict):
+    """Applies a single journal record to ``data``, in place."""
+    op = record["op"]
+    if op == "ban":
+        data.setdefault("banned", set()).add(record["id"])
+    elif op == "unban":
+        data.setdefault("banned", set()).discard(record["id"])
+    elif op == "set":
+        data[record["key"]] = record["value"]
+    elif op == "bulk_done":
+        job = data.get("bulk_job")
+        if job:
+            finished = set(record["ids"])
+            job["pending"] = [guild_id for guild_id in job["pending"] if guild_id not in finished]
+    else:
+        log.warning(f"[GUILDMANAGER] Skipping unknown journal record {record!r}")
+
+
+class Journal:
+    """
+    Snapshot + append-only journal persistence.
+
+    ``path`` holds a full JSON snapshot, ``path.journal`` holds one JSON record per line for every mutation made
+    since. Records are flushed to the OS as soon as they are written and fsynced in batches of ``sync_every``
+    (or whenever :meth:`sync` is called). Once the journal passes ``compact_after`` bytes it is rotated to
+    ``path.journal.old`` and folded into a new snapshot by :meth:`compact`.
+
+    Every record is idempotent when replayed in order on top of a newer snapshot, so a crash at any point during
+    compaction still loads to the right state.
+    """
+
+    def __init__(self, path: str = "./gman.data", *, sync_every: int = 16, compact_after: int = 64 * 1024):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.old_path = self.journal_path + ".old"
+        self.sync_every = sync_every
+        self.compact_after = compact_after
+        self._fp = None
+        self._unsynced = 0
+
+    @property
+    def size(self) -> int:
+        """The size of the live journal, in bytes."""
+        return self._fp.tell() if self._fp is not None else 0
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.size >= self.compact_after
+
+    def load(self, defaults: dict) -> dict:
+        """Loads the snapshot and replays any journals on top of it.
+
+        ``banned`` is returned as a set."""
+        try:
+            with open(self.path) as rfile:
+                data = json.load(rfile)
+            log.info(f"[GUILDMANAGER] loaded data from {self.path}")
+        except (OSError, ValueError) as e:
+            log.warning(
+                f"[GUILDMANAGER] Failed to load data from {self.path} ({str(e)}), creating a new file"
+                f" with default settings."
+            )
+            data = json.loads(json.dumps(defaults))
+            self._write_snapshot(data)
+        data["banned"] = set(data.get("banned", []))
+
+        replayed = 0
+        for path in (self.old_path, self.journal_path):
+            replayed += self._replay(path, data)
+        if replayed:
+            log.info(f"[GUILDMANAGER] replayed {replayed} journal records.")
+        if os.path.exists(self.old_path):
+            # a compaction was interrupted; finish it now that everything has been replayed.
+            self.compact(data)
+
+        self._fp = open(self.journal_path, "a")
+        return data
+
+    def append(self, op: str, **fields):
+        """Appends a record to the journal."""
+        if self._fp is None:
+            raise ValueError(f"the journal at {self.journal_path} is closed")
+        self._fp.write(json.dumps({"op": op, **fields}, separators=(",", ":")) + "\n")
+        self._fp.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """fsyncs any records written since the last sync."""
+        if self._fp is not None and self._unsynced:
+            os.fsync(self._fp.fileno())
+            self._unsynced = 0
+
+    def rotate(self) -> bool:
+        """Moves the live journal aside so it can be compacted, and starts a new one.
+
+        Returns False if a previous compaction has not finished yet."""
+        if os.path.exists(self.old_path):
+            return False
+        self.sync()
+        self._fp.close()
+        os.replace(self.journal_path, self.old_path)
+        self._fp = open(self.journal_path, "a")
+        return True
+
+    def compact(self, data: dict):
+        """Writes ``data`` as the new snapshot and drops the rotated journal.
+
+        ``data`` must reflect every record in the rotated journal. This is safe to run in an executor."""
+        self._write_snapshot(data)
+        try:
+            os.remove(self.old_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self, data: Optional[dict] = None):
+        """Closes the journal, compacting everything into a snapshot first if ``data`` is given."""
+        if data is not None and self.rotate():
+            self.compact(data)
+        self.sync()
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _replay(self, path: str, data: dict) -> int:
+        n = 0
+        good = 0
+        try:
+            with open(path, "rb+") as rfile:
+                for line in rfile:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    if record is None or not line.endswith(b"\n"):
+                        # a torn write from a crash can only ever be the final line; cut it off so new appends
+                        # start on a clean line.
+                        log.warning(f"[GUILDMANAGER] Dropping truncated record at the end of {path}")
+                        rfile.truncate(good)
+                        break
+                    apply(data, record)
+                    good += len(line)
+                    n += 1
+        except FileNotFoundError:
+            pass
+        return n
+
+    def _write_snapshot(self, data: dict):
+        data = dict(data, banned=sorted(data.get("banned", [])))
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as wfile:
+            json.dump(data, wfile)
+            wfile.flush()
+            os.fsync(wfile.fileno())
+        os.replace(tmp, self.path)
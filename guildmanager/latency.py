@@ -0,0 +1,65 @@
+import math
+from array import array
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from .helpers import LazyModule
+
+np = LazyModule("numpy")
+
+
+class LatencySampler:
+    """
+    Fixed-size ring buffers of gateway latency samples (in ms), one per shard.
+
+    Percentiles are computed with numpy over a zero-copy view of the buffers; an EWMA is kept alongside for a
+    cheap smoothed figure. Shard ``None`` is used for non-sharded bots.
+    """
+
+    def __init__(self, size: int = 360, *, alpha: float = 0.1):
+        self.size = size
+        self.alpha = alpha
+        self.samples = 0
+        self.ewma: Dict[Optional[int], float] = {}
+        self._buffers: Dict[Optional[int], array] = {}
+        self._positions: Dict[Optional[int], int] = {}
+
+    @property
+    def shards(self) -> Tuple[Optional[int], ...]:
+        return tuple(self._buffers)
+
+    def sample(self, latencies: Iterable[Tuple[Optional[int], float]]):
+        """Records one sample per ``(shard id, latency in seconds)`` pair. Non-finite latencies are skipped."""
+        self.samples += 1
+        for shard_id, latency in latencies:
+            if not math.isfinite(latency):
+                continue
+            latency *= 1000
+            buffer = self._buffers.get(shard_id)
+            if buffer is None:
+                buffer = self._buffers[shard_id] = array("d", [math.nan]) * self.size
+                self._positions[shard_id] = 0
+                self.ewma[shard_id] = latency
+            pos = self._positions[shard_id]
+            buffer[pos] = latency
+            self._positions[shard_id] = (pos + 1) % self.size
+            self.ewma[shard_id] += self.alpha * (latency - self.ewma[shard_id])
+
+    def average(self, shard_id: Optional[int] = None) -> float:
+        """The EWMA latency of a shard, or the mean of every shard's if ``shard_id`` is None."""
+        if shard_id is not None:
+            return self.ewma.get(shard_id, math.nan)
+        if not self.ewma:
+            return math.nan
+        return sum(self.ewma.values()) / len(self.ewma)
+
+    def percentiles(self, shard_id: Optional[int] = None, q: Sequence[float] = (50, 95, 99)) -> Dict[float, float]:
+        """Latency percentiles over a shard's buffer, or over every shard's buffer if ``shard_id`` is None."""
+        if shard_id is not None and shard_id in self._buffers:
+            values = np.frombuffer(self._buffers[shard_id], dtype=np.float64)
+        elif shard_id is None and self._buffers:
+            values = np.concatenate([np.frombuffer(b, dtype=np.float64) for b in self._buffers.values()])
+        else:
+            return {p: math.nan for p in q}
+        if np.isnan(values).all():
+            return {p: math.nan for p in q}
+        return dict(zip(q, np.nanpercentile(values, q).tolist()))
@@ -0,0 +1,184 @@
+"""
+Call counts, error counts and latency histograms for the cog's commands, listeners and checks.
+
+Recording is a couple of dict lookups and a bisect. While :attr:`Metrics.enabled` is False nothing is timed at all,
+so the only cost left on the hot path is one attribute check.
+"""
+import asyncio
+import functools
+import os
+import time
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# upper bounds in seconds, roughly 2.5x apart; anything slower lands in +Inf.
+BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "calls", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def observe(self, seconds: float, failed: bool = False):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.calls += 1
+        if failed:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile in seconds, interpolating linearly inside the bucket it falls in."""
+        if not self.calls:
+            return float("nan")
+        rank = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """Histograms keyed by ``(kind, name)``, where kind is ``command``, ``listener`` or ``check``."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def observe(self, kind: str, name: str, seconds: float, failed: bool = False):
+        histogram = self.histograms.get((kind, name))
+        if histogram is None:
+            histogram = self.histograms[(kind, name)] = Histogram()
+        histogram.observe(seconds, failed)
+
+    def reset(self):
+        self.histograms = {}
+
+    def render(self) -> str:
+        """Returns every histogram in the Prometheus text exposition format."""
+        lines = [
+            "# HELP guildmanager_calls_total Calls to guildmanager commands, listeners and checks.",
+            "# TYPE guildmanager_calls_total counter",
+        ]
+        items = sorted(self.histograms.items())
+        for (kind, name), h in items:
+            lines.append(f"guildmanager_calls_total{_labels(kind, name)} {h.calls}")
+        lines += [
+            "# HELP guildmanager_errors_total Calls that raised.",
+            "# TYPE guildmanager_errors_total counter",
+        ]
+        for (kind, name), h in items:
+            lines.append(f"guildmanager_errors_total{_labels(kind, name)} {h.errors}")
+        lines += [
+            "# HELP guildmanager_duration_seconds How long calls took.",
+            "# TYPE guildmanager_duration_seconds histogram",
+        ]
+        for (kind, name), h in items:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), h.counts):
+                cumulative += count
+                lines.append(f"guildmanager_duration_seconds_bucket{_labels(kind, name, le=bound)} {cumulative}")
+            lines.append(f"guildmanager_duration_seconds_sum{_labels(kind, name)} {h.sum}")
+            lines.append(f"guildmanager_duration_seconds_count{_labels(kind, name)} {h.calls}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Writes :meth:`render` to ``path`` atomically, for node_exporter's textfile collector."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as fp:
+            fp.write(self.render())
+        os.replace(tmp, path)
+
+    def table(self) -> List[Tuple[str, str, int, int, float, float, float]]:
+        """Returns ``(kind, name, calls, errors, mean ms, p50 ms, p95 ms)`` rows, slowest in total first."""
+        rows = []
+        for (kind, name), h in sorted(self.histograms.items(), key=lambda item: item[1].sum, reverse=True):
+            mean = h.sum / h.calls * 1000 if h.calls else 0.0
+            rows.append((kind, name, h.calls, h.errors, mean, h.quantile(0.5) * 1000, h.quantile(0.95) * 1000))
+        return rows
+
+
+def _labels(kind: str, name: str, **extra) -> str:
+    pairs = [("kind", kind), ("name", name)] + [(k, v) for k, v in extra.items()]
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def timed(kind: str):
+    """Records calls of an async cog method into the cog's ``metrics``, under the method's name."""
+
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return await func(self, *args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = await func(self, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                metrics.observe(kind, name, time.perf_counter() - start, failed)
+
+        return wrapper
+
+    return decorator
+
+
+async def serve(metrics: Metrics, port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+    """Serves :meth:`Metrics.render` over plain HTTP at ``/metrics``."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass  # headers
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
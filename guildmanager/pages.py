@@ -0,0 +1,73 @@
+from collections.abc import Sequence
+from typing import Callable, List, Optional, Union
+
+import discord
+from jishaku.paginators import PaginatorEmbedInterface
+from redbot.core import commands
+
+from .index import GuildIndex
+
+
+class Selection:
+    """Some of an index's guilds, by id, in a given order. Pages like the index itself.
+
+    Guilds that have been left since are returned as None."""
+
+    def __init__(self, guild_ids: List[int], index: GuildIndex):
+        self.guild_ids = guild_ids
+        self.index = index
+
+    def __len__(self):
+        return len(self.guild_ids)
+
+    def at(self, position: int) -> Optional[discord.Guild]:
+        return self.index.get(self.guild_ids[position])
+
+
+class GuildPages(Sequence):
+    """
+    A read-only sequence of pages over a :class:`~guildmanager.index.GuildIndex` or a :class:`Selection` of it.
+
+    Pages are a fixed number of lines, so the page count is a division and a page is only formatted when it is
+    looked at.
+    """
+
+    def __init__(
+        self,
+        index: Union[GuildIndex, Selection],
+        formatter: Callable[[int, discord.Guild], str],
+        *,
+        per_page: int = 15,
+    ):
+        self.index = index
+        self.formatter = formatter
+        self.per_page = per_page
+
+    def __len__(self):
+        return max(-(-len(self.index) // self.per_page), 1)
+
+    def __getitem__(self, page: int) -> str:
+        if page < 0:
+            page += len(self)
+        if not 0 <= page < len(self):
+            raise IndexError(page)
+        start = page * self.per_page
+        end = min(start + self.per_page, len(self.index))
+        return "\n".join(self.formatter(n, self.index.at(n)) for n in range(start, end))
+
+
+class LazyPaginatorInterface(PaginatorEmbedInterface):
+    """A jishaku embed paginator that reads its pages from a :class:`GuildPages`, instead of pre-rendering them."""
+
+    def __init__(self, bot: commands.Bot, pages: GuildPages, **kwargs):
+        self._lazy_pages = pages
+        # the wrapped paginator is only used for its max_size, which bounds a single page.
+        super().__init__(bot, commands.Paginator("", "", max_size=1990), **kwargs)
+
+    @property
+    def pages(self) -> GuildPages:
+        return self._lazy_pages
+
+    @property
+    def page_count(self) -> int:
+        return len(self._lazy_pages)
@@ -0,0 +1,67 @@
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+from .latency import LatencySampler
+
+
+class ShardStats:
+    """
+    Per-shard guild counts, join rates and connection state, kept current by gateway events.
+
+    Shard ``None`` is used for non-sharded bots, matching :class:`~guildmanager.latency.LatencySampler`.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = (), *, window: float = 86400.0):
+        self.window = window
+        self.guilds: Dict[Optional[int], int] = {}
+        self.disconnects: Dict[Optional[int], int] = {}
+        self.connected: Dict[Optional[int], bool] = {}
+        self._joins: Dict[Optional[int], Deque[float]] = {}
+        self.rebuild(guilds)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self.guilds = {}
+        for guild in guilds:
+            self.guilds[guild.shard_id] = self.guilds.get(guild.shard_id, 0) + 1
+
+    def add(self, guild: discord.Guild, *, joined: bool = False):
+        self.guilds[guild.shard_id] = self.guilds.get(guild.shard_id, 0) + 1
+        if joined:
+            self._joins.setdefault(guild.shard_id, deque()).append(time.monotonic())
+
+    def remove(self, guild: discord.Guild):
+        self.guilds[guild.shard_id] = self.guilds.get(guild.shard_id, 1) - 1
+
+    def shard_connected(self, shard_id: Optional[int]):
+        self.connected[shard_id] = True
+
+    def shard_disconnected(self, shard_id: Optional[int]):
+        self.connected[shard_id] = False
+        self.disconnects[shard_id] = self.disconnects.get(shard_id, 0) + 1
+
+    def join_rate(self, shard_id: Optional[int]) -> float:
+        """Guild joins per hour on a shard, over the last ``window`` seconds."""
+        joins = self._joins.get(shard_id)
+        if not joins:
+            return 0.0
+        cutoff = time.monotonic() - self.window
+        while joins and joins[0] < cutoff:
+            joins.popleft()
+        return len(joins) / (self.window / 3600)
+
+    def degraded(self, latency: LatencySampler, *, threshold: float = 1000.0) -> List[Tuple[Optional[int], str]]:
+        """Returns ``(shard id, reason)`` for every shard that is disconnected or whose p95 latency is over
+        ``threshold`` ms."""
+        result = []
+        for shard_id in sorted(set(self.guilds) | set(self.connected) | set(latency.shards), key=lambda s: s or 0):
+            if self.connected.get(shard_id) is False:
+                result.append((shard_id, "disconnected"))
+                continue
+            p95 = latency.percentiles(shard_id, (95,))[95]
+            if not math.isnan(p95) and p95 > threshold:
+                result.append((shard_id, f"p95 latency {round(p95)}ms"))
+        return result
@@ -0,0 +1,86 @@
+import logging
+from typing import Iterable, Tuple
+
+import discord
+from redbot.core import commands
+
+log = logging.getLogger("red.kko-gm-ported.guildmanager.stats")
+
+
+class BotStats:
+    """
+    Running counters for the ``guilds`` embed.
+
+    Channel and emoji counts are kept up to date by gateway events. Command counts are recounted only when the
+    loaded cogs/extensions/commands change. With ``debug`` on, :meth:`verify` recounts everything and logs drift.
+    """
+
+    def __init__(self, bot: commands.Bot, *, debug: bool = False):
+        self.bot = bot
+        self.debug = debug
+        self.channels = 0
+        self.emojis = 0
+        self.single_commands = 0
+        self.group_commands = 0
+        self.sub_commands = 0
+        self._command_signature = None
+        self.rebuild(bot.guilds)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self.channels, self.emojis = self._count(guilds)
+        self._command_signature = None
+
+    def add_guild(self, guild: discord.Guild):
+        self.channels += len(guild.channels)
+        self.emojis += len(guild.emojis)
+
+    def remove_guild(self, guild: discord.Guild):
+        self.channels -= len(guild.channels)
+        self.emojis -= len(guild.emojis)
+
+    def commands_changed(self):
+        """Marks the command counts as stale."""
+        self._command_signature = None
+
+    @property
+    def commands(self) -> Tuple[int, int, int]:
+        """Returns ``(single, group, sub)`` command counts."""
+        signature = (len(self.bot.cogs), len(self.bot.extensions), len(self.bot.all_commands))
+        if signature != self._command_signature:
+            self.single_commands, self.group_commands, self.sub_commands = self._count_commands()
+            self._command_signature = signature
+        return self.single_commands, self.group_commands, self.sub_commands
+
+    def verify(self) -> bool:
+        """Recounts everything, logging and fixing any counter that drifted. Returns True if nothing drifted."""
+        channels, emojis = self._count(self.bot.guilds)
+        cmds = self._count_commands()
+        ok = True
+        for name, kept, real in (
+            ("channels", self.channels, channels),
+            ("emojis", self.emojis, emojis),
+            ("commands", (self.single_commands, self.group_commands, self.sub_commands), cmds),
+        ):
+            if kept != real:
+                log.warning(f"[GUILDMANAGER] stats drift: {name} counter is {kept}, recount gave {real}")
+                ok = False
+        self.channels, self.emojis = channels, emojis
+        self.single_commands, self.group_commands, self.sub_commands = cmds
+        return ok
+
+    @staticmethod
+    def _count(guilds: Iterable[discord.Guild]) -> Tuple[int, int]:
+        channels = emojis = 0
+        for guild in guilds:
+            channels += len(guild.channels)
+            emojis += len(guild.emojis)
+        return channels, emojis
+
+    def _count_commands(self) -> Tuple[int, int, int]:
+        groups = subs = 0
+        for command in self.bot.walk_commands():
+            if isinstance(command, commands.Group):
+                groups += 1
+            if command.parent:
+                subs += 1
+        return len(self.bot.commands), groups, subs
@@ -0,0 +1,57 @@
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+import discord
+
+
+def _epoch(dt: datetime) -> float:
+    # discord.py hands out naive UTC datetimes.
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    """Returns the (start, end) datetimes of a month."""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+class JoinTimeline:
+    """
+    The bot's guild join dates, kept sorted in a compact ``array('d')`` of epoch timestamps.
+
+    Range lookups are two bisects, so the growth commands never need to touch the guild objects.
+    """
+
+    def __init__(self, guilds: Iterable[discord.Guild] = ()):
+        self.timestamps = array("d")
+        self._joined: Dict[int, float] = {}
+        self.rebuild(guilds)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def rebuild(self, guilds: Iterable[discord.Guild]):
+        self._joined = {g.id: _epoch(g.me.joined_at) for g in guilds if g.me is not None and g.me.joined_at}
+        self.timestamps = array("d", sorted(self._joined.values()))
+
+    def add(self, guild: discord.Guild):
+        if guild.id in self._joined or guild.me is None or not guild.me.joined_at:
+            return
+        ts = self._joined[guild.id] = _epoch(guild.me.joined_at)
+        insort(self.timestamps, ts)
+
+    def remove(self, guild_id: int):
+        ts = self._joined.pop(guild_id, None)
+        if ts is not None:
+            del self.timestamps[bisect_left(self.timestamps, ts)]
+
+    def between(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> array:
+        """Returns the sorted join timestamps in [start, end)."""
+        lo = bisect_left(self.timestamps, _epoch(start)) if start else 0
+        hi = bisect_left(self.timestamps, _epoch(end)) if end else len(self.timestamps)
+        return self.timestamps[lo:hi]